@@ -1,91 +1,121 @@
+import time
+started = time.perf_counter()
 import logging
-from package.generic.utils import data
+from package.generic.utils import data, ColoredFormatter
+from package.generic import metrics, runtime
 import sys
 import discord
 from discord.ext import commands
 import sqlite3
 
+importTime = time.perf_counter() - started
+
 desc = """A generic miniTWOW Discord bot and website.
 Maintainer is currently PMPuns#5728."""
 discord_logger = logging.getLogger('discord')
-discord_logger.setLevel(logging.INFO)
 sql_logger = logging.getLogger("sqlite3")
-sql_logger.setLevel(logging.DEBUG)
-handler = logging.StreamHandler(stream=sys.stdout)
-handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
-discord_logger.addHandler(handler)
-sql_logger.addHandler(handler)
-bot = commands.Bot(command_prefix=data["prefix"], descrption=desc)
 
-extensions = ["generic.admin", "mtwow.discord.admin"]
+def main():
+    # Everything with side effects is in here: compute workers re-import this module as __mp_main__,
+    # and must not read the config or build a bot of their own.
+    discord_logger.setLevel(logging.INFO)
+    handler = logging.StreamHandler(stream=sys.stdout)
+    handler.setFormatter(ColoredFormatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
+    discord_logger.addHandler(handler)
+    sql_logger.addHandler(handler)
+    # read the config up front, so a broken secrets.json stops the bot before it connects
+    data.load()
+    # per-query debug logging is expensive, so it's opt in
+    sql_logger.setLevel(data.get("sqlLogLevel", "INFO"))
+    bot = commands.Bot(command_prefix=data["prefix"], descrption=desc)
+    metrics.instrument(bot)
+
+    extensions = ["generic.admin", "mtwow.discord.admin"]
 
-@bot.event
-async def on_ready():
-    if isinstance(data.get("owner"), int):
-        discord_logger.debug("Set owner to {:d}".format(data["owner"]))
-        bot.owner_id = data["owner"]
-    else:
-        data["owner"] = await bot.application_info().owner.id
-    discord_logger.info("Bot is ready!")
-    discord_logger.info("Running as {:s} with ID {:d}".format(bot.user.name, bot.user.id))
-    for extension in extensions:
-        discord_logger.debug("Loading extension {:s}".format(extension))
+    @bot.event
+    async def on_ready():
+        if isinstance(data.get("owner"), int):
+            discord_logger.debug("Set owner to %d", data["owner"])
+            bot.owner_id = data["owner"]
+        else:
+            data["owner"] = await bot.application_info().owner.id
+        discord_logger.info("Bot is ready!")
+        discord_logger.info("Running as %s with ID %d", bot.user.name, bot.user.id)
+        for extension in extensions:
+            discord_logger.debug("Loading extension %s", extension)
+            start = time.perf_counter()
+            try:
+                bot.load_extension("package." + extension)
+                discord_logger.info("Loaded extension %s in %.0f ms", extension, (time.perf_counter() - start) * 1000)
+            except commands.ExtensionNotFound:
+                discord_logger.debug("Failed to load extension %s: Not found.", extension)
+            except commands.ExtensionAlreadyLoaded:
+                discord_logger.debug("Failed to load extension %s: %s was already loaded.", extension, extension)
+            except commands.ExtensionFailed:
+                discord_logger.debug("Failed to load extension %s: %s errored in its entry function.", extension, extension)
+        # the bot is still useful without its web server, e.g. if something else has the port
         try:
-            bot.load_extension("package." + extension)
-        except commands.ExtensionNotFound:
-            discord_logger.debug("Failed to load extension {:s}: Not found.".format(extension))
-        except commands.ExtensionAlreadyLoaded:
-            discord_logger.debug("Failed to load extension {0:s}: {0:s} was already loaded.".format(extension))
-        except commands.ExtensionFailed:
-            discord_logger.debug("Failed to load extension {0:s}: {0:s} errored in its entry function.".format(extension))
+            await metrics.start(data.get("webHost", "127.0.0.1"), data["portNum"])
+        except OSError as e:
+            discord_logger.error("Could not start web server on port %d: %s", data["portNum"], e)
+        discord_logger.info("Cold start took %.0f ms, of which %.0f ms was imports", (time.perf_counter() - started) * 1000, importTime * 1000)
 
-@bot.event
-async def on_message(message: discord.Message):
-    if message.author.bot:
-        return
-    await bot.process_commands(message)
+    @bot.event
+    async def on_message(message: discord.Message):
+        if message.author.bot:
+            return
+        await bot.process_commands(message)
 
-@bot.command(brief="Kills the bot.")
-@commands.check(commands.is_owner())
-async def kill(ctx: commands.Context):
-    discord_logger.info("Received shutdown command from {:s}".format(str(ctx.message.author)))
-    bot.close()
-    sys.exit(0)
+    @bot.command(brief="Kills the bot.")
+    @commands.check(commands.is_owner())
+    async def kill(ctx: commands.Context):
+        discord_logger.info("Received shutdown command from %s", ctx.message.author)
+        # run returns once the bot is closed, and main closes everything else
+        await bot.close()
 
-@bot.command(brief="Loads starting extensions.")
-@commands.check(commands.is_owner())
-async def load_all(ctx: commands.Context):
-    discord_logger.info("Received load_all command from {:s}".format(str(ctx.message.author)))
-    count = 0
-    for extension in extensions:
-        discord_logger.debug("Loading extension {:s}".format(extension))
-        try:
-            bot.load_extension("package." + extension)
-            count += 1
-        except commands.ExtensionNotFound:
-            discord_logger.debug("Failed to load extension {:s}: Not found.".format(extension))
-        except commands.ExtensionAlreadyLoaded:
-            discord_logger.debug("Failed to load extension {0:s}: {0:s} was already loaded.".format(extension))
-        except commands.ExtensionFailed:
-            discord_logger.debug("Failed to load extension {0:s}: {0:s} errored in its entry function.".format(extension))
-    await ctx.send("Loaded {:d} of {:d} extensions. Check debug logs for more details.".format(count, len(extensions)))
+    @bot.command(brief="Loads starting extensions.")
+    @commands.check(commands.is_owner())
+    async def load_all(ctx: commands.Context):
+        discord_logger.info("Received load_all command from %s", ctx.message.author)
+        count = 0
+        for extension in extensions:
+            discord_logger.debug("Loading extension %s", extension)
+            try:
+                bot.load_extension("package." + extension)
+                count += 1
+            except commands.ExtensionNotFound:
+                discord_logger.debug("Failed to load extension %s: Not found.", extension)
+            except commands.ExtensionAlreadyLoaded:
+                discord_logger.debug("Failed to load extension %s: %s was already loaded.", extension, extension)
+            except commands.ExtensionFailed:
+                discord_logger.debug("Failed to load extension %s: %s errored in its entry function.", extension, extension)
+        await ctx.send("Loaded {:d} of {:d} extensions. Check debug logs for more details.".format(count, len(extensions)))
 
-@bot.command(brief="Reloads starting extensions.")
-@commands.check(commands.is_owner())
-async def reload_all(ctx: commands.Context):
-    discord_logger.info("Received reload_all command from {:s}".format(str(ctx.message.author)))
-    count = 0
-    for extension in extensions:
-        discord_logger.debug("Reloading extension {:s}".format(extension))
-        try:
-            bot.reload_extension("package." + extension)
-            count += 1
-        except commands.ExtensionNotFound:
-            discord_logger.debug("Failed to reload extension {:s}: Not found.".format(extension))
-        except commands.ExtensionAlreadyLoaded:
-            discord_logger.debug("Failed to reload extension {0:s}: {0:s} was already loaded.".format(extension))
-        except commands.ExtensionFailed:
-            discord_logger.debug("Failed to reload extension {0:s}: {0:s} errored in its entry function.".format(extension))
-    await ctx.send("Reloaded {:d} of {:d} extensions. Check debug logs for more details.".format(count, len(extensions)))
-    
-bot.run(data["token"])
+    @bot.command(brief="Reloads starting extensions.")
+    @commands.check(commands.is_owner())
+    async def reload_all(ctx: commands.Context):
+        discord_logger.info("Received reload_all command from %s", ctx.message.author)
+        count = 0
+        for extension in extensions:
+            discord_logger.debug("Reloading extension %s", extension)
+            start = time.perf_counter()
+            try:
+                bot.reload_extension("package." + extension)
+                discord_logger.info("Reloaded extension %s in %.0f ms", extension, (time.perf_counter() - start) * 1000)
+                count += 1
+            except commands.ExtensionNotFound:
+                discord_logger.debug("Failed to reload extension %s: Not found.", extension)
+            except commands.ExtensionAlreadyLoaded:
+                discord_logger.debug("Failed to reload extension %s: %s was already loaded.", extension, extension)
+            except commands.ExtensionFailed:
+                discord_logger.debug("Failed to reload extension %s: %s errored in its entry function.", extension, extension)
+        await ctx.send("Reloaded {:d} of {:d} extensions. Check debug logs for more details.".format(count, len(extensions)))
+
+    try:
+        bot.run(data["token"])
+    finally:
+        # Closed here rather than at exit, while the database threads that write out buffered votes are still running.
+        runtime.get(bot).close()
+
+if __name__ == "__main__":
+    main()
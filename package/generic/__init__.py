@@ -1 +1 @@
-from . import utils, admin
\ No newline at end of file
+from . import utils, web, metrics, admin, runtime
\ No newline at end of file
@@ -9,7 +9,7 @@ class Administrator(commands.Cog):
     @commands.command(brief="Reloads a module.")
     @commands.check(commands.is_owner())
     async def reload(self, ctx: commands.Context, module: str):
-        discord_logger.info("{:s} issued command to reload module {:s}".format(str(ctx.message.author), module))
+        discord_logger.info("%s issued command to reload module %s", ctx.message.author, module)
         try:
             ctx.bot.reload_extension("package." + module)
             await ctx.send("Reloaded extension {:s}.".format(module))
@@ -23,7 +23,7 @@ class Administrator(commands.Cog):
     @commands.command(brief="Unloads a module.")
     @commands.check(commands.is_owner())
     async def unload(self, ctx: commands.Context, module: str):
-        discord_logger.info("{:s} issued command to unload module {:s}".format(str(ctx.message.author), module))
+        discord_logger.info("%s issued command to unload module %s", ctx.message.author, module)
         try:
             ctx.bot.unload_extension("package." + module)
         except commands.ExtensionNotLoaded:
@@ -32,7 +32,7 @@ class Administrator(commands.Cog):
     @commands.command(brief="Loads a module.")
     @commands.check(commands.is_owner())
     async def load(self, ctx: commands.Context, module: str):
-        discord_logger.info("{:s} issued command to load module {:s}".format(str(ctx.message.author), module))
+        discord_logger.info("%s issued command to load module %s", ctx.message.author, module)
         try:
             ctx.bot.load_extension(module)
         except commands.ExtensionNotFound:
@@ -0,0 +1,139 @@
+"""
+In-memory performance metrics, served in the Prometheus text format at /metrics.
+"""
+from . import web
+import asyncio
+import threading
+import time
+from typing import Callable, Dict
+
+class Histogram:
+    """ Log-scale latency histogram with fixed memory.
+        Bucket i counts samples under 2 ** i microseconds, so recording is O(1) however long it runs.
+    """
+    BUCKETS = 40
+
+    def __init__(self):
+        self.buckets = [0] * Histogram.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, seconds: float):
+        bucket = min(int(seconds * 1000000).bit_length(), Histogram.BUCKETS - 1)
+        with self.lock:
+            self.buckets[bucket] += 1
+            self.count += 1
+            self.total += seconds
+
+    def percentile(self, p: float) -> float:
+        """ Upper bound in seconds of the bucket holding the p-th percentile, 0 <= p <= 1.
+        """
+        with self.lock:
+            target = p * self.count
+            seen = 0
+            for i, n in enumerate(self.buckets):
+                seen += n
+                if n and seen >= target:
+                    return (1 << i) / 1000000
+        return 0.0
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+class Registry:
+    """ Command counts, errors and latencies, event loop lag, and any extra gauges other modules register.
+        Rendered in the Prometheus text format.
+    """
+    def __init__(self):
+        self.calls = {}
+        self.errors = {}
+        self.latency = {}
+        self.loopLag = Histogram()
+        self.lastLag = 0.0
+        # name -> (help, callable returning {labels: value})
+        self.gauges = {}
+
+    def recordCommand(self, name: str, seconds: float, failed: bool):
+        if name not in self.latency:
+            self.latency[name] = Histogram()
+        self.latency[name].record(seconds)
+        self.calls[name] = self.calls.get(name, 0) + 1
+        if failed:
+            self.recordError(name)
+
+    def recordError(self, name: str):
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def gauge(self, name: str, help: str, func: Callable[[], Dict[str, float]]):
+        self.gauges[name] = (help, func)
+
+    def render(self) -> str:
+        lines = []
+        def family(name: str, kind: str, help: str):
+            lines.append("# HELP {:s} {:s}".format(name, help))
+            lines.append("# TYPE {:s} {:s}".format(name, kind))
+        family("bot_command_invocations_total", "counter", "Commands invoked.")
+        lines += ['bot_command_invocations_total{{command="{:s}"}} {:d}'.format(k, v) for k, v in sorted(self.calls.items())]
+        family("bot_command_errors_total", "counter", "Commands that failed.")
+        lines += ['bot_command_errors_total{{command="{:s}"}} {:d}'.format(k, v) for k, v in sorted(self.errors.items())]
+        family("bot_command_latency_seconds", "summary", "Command latency. Quantiles are log2 bucket upper bounds.")
+        for k, h in sorted(self.latency.items()):
+            for q in quantiles:
+                lines.append('bot_command_latency_seconds{{command="{:s}",quantile="{:g}"}} {:g}'.format(k, q, h.percentile(q)))
+            lines.append('bot_command_latency_seconds_sum{{command="{:s}"}} {:g}'.format(k, h.total))
+            lines.append('bot_command_latency_seconds_count{{command="{:s}"}} {:d}'.format(k, h.count))
+        family("bot_event_loop_lag_seconds", "summary", "How late the event loop woke up a sleeping sampler.")
+        for q in quantiles:
+            lines.append('bot_event_loop_lag_seconds{{quantile="{:g}"}} {:g}'.format(q, self.loopLag.percentile(q)))
+        lines.append("bot_event_loop_lag_seconds_sum {:g}".format(self.loopLag.total))
+        lines.append("bot_event_loop_lag_seconds_count {:d}".format(self.loopLag.count))
+        family("bot_event_loop_lag_last_seconds", "gauge", "Most recent event loop lag sample.")
+        lines.append("bot_event_loop_lag_last_seconds {:g}".format(self.lastLag))
+        for name, (help, func) in sorted(self.gauges.items()):
+            family(name, "gauge", help)
+            for labels, value in sorted(func().items()):
+                lines.append("{:s}{:s} {:g}".format(name, labels, value))
+        return "\n".join(lines) + "\n"
+
+quantiles = (0.5, 0.9, 0.99)
+registry = Registry()
+
+async def sampleLoopLag(interval: float = 0.5):
+    # sleep for a fixed time and see how late we wake up; anything over is time the loop was busy
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(time.perf_counter() - start - interval, 0.0)
+        registry.lastLag = lag
+        registry.loopLag.record(lag)
+
+async def serveMetrics(request: web.Request) -> web.Response:
+    return web.Response(200, registry.render().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+
+def instrument(bot):
+    """ Times every command the bot runs, whichever cog it's in.
+    """
+    async def before(ctx):
+        ctx.metricsStart = time.perf_counter()
+
+    async def after(ctx):
+        registry.recordCommand(ctx.command.qualified_name, time.perf_counter() - ctx.metricsStart, ctx.command_failed)
+
+    async def failed(ctx, error):
+        # errors raised inside a command are counted by after(); this catches checks and argument conversion
+        if ctx.command is not None and not hasattr(ctx, "metricsStart"):
+            registry.recordError(ctx.command.qualified_name)
+
+    bot.before_invoke(before)
+    bot.after_invoke(after)
+    bot.add_listener(failed, "on_command_error")
+
+lagSampler = None
+
+async def start(host: str, port: int):
+    global lagSampler
+    if lagSampler is None:
+        lagSampler = asyncio.ensure_future(sampleLoopLag())
+    web.route("/metrics", serveMetrics)
+    await web.start(host, port)
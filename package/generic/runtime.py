@@ -0,0 +1,84 @@
+"""
+State that outlives the extensions using it.
+Reloading an extension re-runs its module, so anything it keeps in module globals starts over.
+Extensions keep connections, timers and background tasks here instead, on the bot,
+so a reload picks them back up rather than opening them again.
+"""
+import atexit
+import logging
+from typing import Callable, Optional
+discord_logger = logging.getLogger("discord")
+
+class Runtime:
+    def __init__(self):
+        # name -> resource, in the order they were made
+        self.resources = {}
+        # name -> function that shuts the resource down
+        self.closers = {}
+        # name -> function that saves what it can of the resource, if the process exits without close() being called
+        self.abandoners = {}
+        self.closed = False
+        # Only a last resort: the interpreter shuts its thread pools down before atexit handlers run,
+        # so the bot's shutdown path has to call close() itself.
+        atexit.register(self.abandon)
+
+    def resource(self, name: str, factory: Callable[[], object], close: Optional[Callable[[object], None]] = None,
+            abandon: Optional[Callable[[object], None]] = None):
+        """ The resource called name, made by factory() the first time it's asked for.
+            close(resource) is run when the bot shuts down. abandon(resource) is run instead if the process exits
+            without the runtime being closed, by which point it can't use any thread pools.
+        """
+        if name not in self.resources:
+            discord_logger.debug("Creating runtime resource %s", name)
+            self.resources[name] = factory()
+            if close is not None:
+                self.closers[name] = close
+            if abandon is not None:
+                self.abandoners[name] = abandon
+        return self.resources[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.resources
+
+    def release(self, name: str):
+        """ Closes and forgets a resource now, so the next resource() call makes a new one.
+        """
+        resource = self.resources.pop(name, None)
+        self.abandoners.pop(name, None)
+        close = self.closers.pop(name, None)
+        if close is not None:
+            close(resource)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        # last made, first closed, since later resources may use earlier ones
+        for name in reversed(list(self.resources)):
+            try:
+                self.release(name)
+            except Exception:
+                discord_logger.exception("Failed to close runtime resource %s", name)
+        atexit.unregister(self.abandon)
+
+    def abandon(self):
+        if self.closed:
+            return
+        self.closed = True
+        discord_logger.error("Exiting without closing the runtime, %d resources left open", len(self.resources))
+        for name in reversed(list(self.resources)):
+            abandon = self.abandoners.get(name)
+            if abandon is None:
+                continue
+            try:
+                abandon(self.resources[name])
+            except Exception:
+                discord_logger.exception("Failed to save runtime resource %s", name)
+
+def get(bot) -> Runtime:
+    """ The bot's Runtime, made on first use.
+    """
+    runtime = getattr(bot, "runtime", None)
+    if runtime is None:
+        runtime = bot.runtime = Runtime()
+    return runtime
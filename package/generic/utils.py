@@ -1,4 +1,5 @@
 import logging
+import collections.abc
 import json
 import sys
 from typing import Tuple, Union
@@ -88,31 +89,29 @@ class ColoredTerminalLogger(logging.Logger):
         print(ColoredTerminalLogger.BOLD + "REALLY IMPORTANT." + ColoredTerminalLogger.UNBOLD + " Or not." + ColoredTerminalLogger.RESET)
         print(ColoredTerminalLogger.ULINE + "Read this." + ColoredTerminalLogger.UNLINE + " Or don't." + ColoredTerminalLogger.RESET)
 
-    def info(self, msg: str, *args, **kwargs):
-        if (self.getEffectiveLevel() <= logging.INFO):
-            logging.Logger.info(self, ColoredTerminalLogger.INFO + msg + ColoredTerminalLogger.RESET, *args, **kwargs)
-
-    def critical(self, msg: str, *args, **kwargs):
-        if (self.getEffectiveLevel() <= logging.CRITICAL):
-            logging.Logger.critical(self, ColoredTerminalLogger.FAIL + msg + ColoredTerminalLogger.RESET, *args, **kwargs)
-
-    def debug(self, msg: str, *args, **kwargs):
-        if (self.getEffectiveLevel() <= logging.DEBUG):
-            logging.Logger.debug(self, ColoredTerminalLogger.DEBUG + msg + ColoredTerminalLogger.RESET, *args, **kwargs)
-
-    def warning(self, msg: str, *args, **kwargs) -> str:
-        if (self.getEffectiveLevel() <= logging.WARNING):
-            logging.Logger.warning(self, ColoredTerminalLogger.WARN + msg + ColoredTerminalLogger.RESET, *args, **kwargs)
+class ColoredFormatter(logging.Formatter):
+    """ Colours records by level when they're emitted, rather than on every logging call.
+        Records below the logger's level never get this far, so they cost nothing.
+    """
+    COLORS = {
+        logging.DEBUG: ColoredTerminalLogger.DEBUG,
+        logging.INFO: ColoredTerminalLogger.INFO,
+        logging.WARNING: ColoredTerminalLogger.WARN,
+        logging.ERROR: ColoredTerminalLogger.FAIL,
+        logging.CRITICAL: ColoredTerminalLogger.FAIL
+    }
 
-    def error(self, msg: str, *args, **kwargs) -> str:
-        if (self.getEffectiveLevel() <= logging.ERROR):
-            logging.Logger.error(self, ColoredTerminalLogger.FAIL + msg + ColoredTerminalLogger.RESET, *args, **kwargs)
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        color = ColoredFormatter.COLORS.get(record.levelno)
+        if color is None:
+            return super().formatMessage(record)
+        return color + super().formatMessage(record) + ColoredTerminalLogger.RESET
 
 logging.setLoggerClass(ColoredTerminalLogger)
 discord_logger = logging.getLogger("discord")
 
-def load_data() -> dict:
-    with open("secrets.json", "r") as f:
+def load_data(path: str = "secrets.json") -> dict:
+    with open(path, "r") as f:
         data = json.load(f)
     if data is None:
         discord_logger.critical("Could not load data parameters! Aborting")
@@ -132,8 +131,35 @@ def load_data() -> dict:
         data["prefix"] = "p?"
     return data
 
-    
-data = load_data()
+class Config(collections.abc.MutableMapping):
+    """ The bot's config, read from path the first time anything looks at it rather than on import.
+        Call load() to read it at a time of your choosing instead, e.g. first thing on startup.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.values = None
+
+    def load(self) -> dict:
+        if self.values is None:
+            self.values = load_data(self.path)
+        return self.values
+
+    def __getitem__(self, key):
+        return self.load()[key]
+
+    def __setitem__(self, key, value):
+        self.load()[key] = value
+
+    def __delitem__(self, key):
+        del self.load()[key]
+
+    def __iter__(self):
+        return iter(self.load())
+
+    def __len__(self) -> int:
+        return len(self.load())
+
+data = Config("secrets.json")
 
 if __name__ == "__main__":
     ColoredTerminalLogger.test()
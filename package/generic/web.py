@@ -0,0 +1,82 @@
+"""
+A small HTTP/1.1 server on the bot's event loop, for the endpoints that live on portNum.
+Handlers are registered by path prefix and return a Response.
+"""
+import asyncio
+import logging
+import urllib.parse
+from typing import Awaitable, Callable, Dict
+discord_logger = logging.getLogger("discord")
+reasons = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+class Request:
+    def __init__(self, method: str, target: str, headers: Dict[str, str]):
+        self.method = method
+        url = urllib.parse.urlsplit(target)
+        self.path = urllib.parse.unquote(url.path)
+        self.query = dict(urllib.parse.parse_qsl(url.query))
+        # header names are lowercased
+        self.headers = headers
+
+class Response:
+    def __init__(self, status: int, body: bytes = b"", contentType: str = "text/plain; charset=utf-8", headers: Dict[str, str] = None):
+        self.status = status
+        self.body = body
+        self.headers = {"Content-Type": contentType}
+        if headers:
+            self.headers.update(headers)
+
+# path prefix -> handler, longest prefix wins
+routes = {}
+server = None
+
+def route(prefix: str, handler: Callable[[Request], Awaitable[Response]]):
+    routes[prefix] = handler
+
+def unroute(prefix: str):
+    routes.pop(prefix, None)
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        line = (await reader.readline()).decode("latin-1").split()
+        headers = {}
+        while True:
+            header = (await reader.readline()).decode("latin-1")
+            if header in ("\r\n", "\n", ""):
+                break
+            name, _, value = header.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if len(line) != 3:
+            response = Response(400, b"Bad request.")
+        elif line[0] not in ("GET", "HEAD"):
+            response = Response(405, b"Method not allowed.")
+        else:
+            request = Request(line[0], line[1], headers)
+            matches = [prefix for prefix in routes if request.path.startswith(prefix)]
+            if matches:
+                try:
+                    response = await routes[max(matches, key=len)](request)
+                except Exception:
+                    discord_logger.exception("Web handler for %s failed", request.path)
+                    response = Response(500, b"Internal server error.")
+            else:
+                response = Response(404, b"Not found.")
+        head = ["HTTP/1.1 {:d} {:s}".format(response.status, reasons.get(response.status, "Unknown"))]
+        head += ["{:s}: {:s}".format(k, v) for k, v in response.headers.items()]
+        head += ["Content-Length: {:d}".format(len(response.body)), "Connection: close", "", ""]
+        writer.write("\r\n".join(head).encode("latin-1"))
+        if len(line) == 3 and line[0] != "HEAD":
+            writer.write(response.body)
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def start(host: str, port: int):
+    """ Starts the server if it isn't running yet.
+    """
+    global server
+    if server is None:
+        server = await asyncio.start_server(handle, host, port)
+        discord_logger.info("Web server listening on %s:%d", host, port)
@@ -0,0 +1,112 @@
+"""
+Synthetic contest benchmarks for the mtwow core.
+Runs a whole round against a throwaway SQLite file by calling the mtwow.general functions directly,
+and times every call so results can be compared between commits.
+"""
+from ..general import sqlutils, user, admin, votes
+from ...generic.utils import data
+import os
+import random
+import string
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+class Timings:
+    def __init__(self):
+        # operation -> list of seconds per call
+        self.samples = {}
+        self.errors = {}
+
+    def time(self, op: str, func: Callable, *args):
+        start = time.perf_counter()
+        res = func(*args)
+        self.samples.setdefault(op, []).append(time.perf_counter() - start)
+        if isinstance(res, tuple) and res[0] == 2:
+            self.errors[op] = self.errors.get(op, 0) + 1
+        return res
+
+    def summary(self) -> Dict[str, dict]:
+        res = {}
+        for op, samples in self.samples.items():
+            samples = sorted(samples)
+            total = sum(samples)
+            res[op] = {
+                "count": len(samples),
+                "errors": self.errors.get(op, 0),
+                "totalSeconds": total,
+                "perSecond": len(samples) / total if total > 0 else None,
+                "p50Ms": samples[len(samples) // 2] * 1000,
+                "p99Ms": samples[min(int(len(samples) * 0.99), len(samples) - 1)] * 1000
+            }
+        return res
+
+def randomResponse(rand: random.Random) -> str:
+    return " ".join("".join(rand.choice(string.ascii_lowercase) for j in range(rand.randint(1, 8))) for i in range(rand.randint(6, 14)))
+
+def run(contestants: int = 500, responses: int = 1, voters: int = 500, votesPerVoter: int = 5, screenSize: int = 10, seed: int = 0, path: str = None) -> dict:
+    """ Plays one synthetic round and returns the timings. The database goes in a temp directory unless path is given,
+        in which case it's wiped first.
+        seed fixes the responses and votes. Screens are still drawn however the bot draws them, so they aren't seeded.
+    """
+    rand = random.Random(seed)
+    timings = Timings()
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlutils.connect(path or os.path.join(tmp, "bench.db"))
+        try:
+            if path:
+                sqlutils.wipe(conn)
+            sqlutils.init(conn)
+            admin.start_signups(conn, 24 * 60 * 60 * 1000)
+            # real user IDs are snowflakes, so these can't collide with the owner's
+            uids = [10 ** 17 + i for i in range(contestants)]
+            for uid in uids:
+                timings.time("signup", user.signup, conn, uid)
+            timings.time("start_responding", admin.start_responding, conn, responses, 24 * 60 * 60 * 1000, "Benchmark prompt.")
+            for uid in uids:
+                for rid in range(1, responses + 1):
+                    timings.time("respond", user.respond, conn, uid, rid, randomResponse(rand))
+            timings.time("end_responding", admin.end_responding, conn)
+            timings.time("start_voting", admin.start_voting, conn, -1, [screenSize])
+            voterIDs = [uids[i] if i < len(uids) else 2 * 10 ** 17 + i for i in range(voters)]
+            for i in range(votesPerVoter):
+                timings.time("newScreens", user.newScreens, conn, [(uid, i) for uid in voterIDs], screenSize)
+            letters = string.ascii_uppercase[:screenSize]
+            for uid in voterIDs:
+                for vid in range(votesPerVoter):
+                    res = timings.time("newScreen", user.newScreen, conn, uid, vid, screenSize)
+                    if res[0] != 0:
+                        continue
+                    gseed = user.getGSeed(res[1])
+                    timings.time("getScreen", user.getScreen, conn, gseed)
+                    timings.time("submitVote", votes.submitVote, conn, uid, vid, gseed, "".join(rand.sample(letters, len(letters))))
+                # stands in for the bot's background top up
+                timings.time("topUpPool", user.topUpPool, conn)
+            pool = dict(user.poolStats())
+            timings.time("flushVotes", votes.flushVotes, conn)
+            timings.time("end_voting", admin.end_voting, conn)
+        finally:
+            sqlutils.close(conn)
+    return {
+        "commit": currentCommit(),
+        "time": int(time.time()),
+        "config": {
+            "contestants": contestants, "responses": responses, "voters": voters, "votesPerVoter": votesPerVoter,
+            "screenSize": screenSize, "seed": seed, "voteConfig": data.get("voteConfig")
+        },
+        "results": timings.summary(),
+        "screenPool": pool
+    }
+
+def currentCommit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def formatReport(report: dict) -> List[str]:
+    lines = ["{:<18s} {:>8s} {:>7s} {:>12s} {:>10s} {:>10s}".format("operation", "count", "errors", "ops/s", "p50 ms", "p99 ms")]
+    for op, r in report["results"].items():
+        lines.append("{:<18s} {:>8d} {:>7d} {:>12.1f} {:>10.3f} {:>10.3f}".format(op, r["count"], r["errors"], r["perSecond"] or 0, r["p50Ms"], r["p99Ms"]))
+    return lines
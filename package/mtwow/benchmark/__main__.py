@@ -0,0 +1,30 @@
+"""
+python -m package.mtwow.benchmark [options]
+Runs one synthetic round, prints the timings and saves them as JSON.
+"""
+from . import run, formatReport
+import argparse
+import json
+import os
+import sys
+
+parser = argparse.ArgumentParser(description="Benchmark the mtwow core against a synthetic contest.")
+parser.add_argument("--contestants", type=int, default=500)
+parser.add_argument("--responses", type=int, default=1, help="responses per contestant")
+parser.add_argument("--voters", type=int, default=500)
+parser.add_argument("--votes", type=int, default=5, help="votes per voter")
+parser.add_argument("--screen-size", type=int, default=10)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--db", default=None, help="database file to use instead of a temp file; it gets wiped")
+parser.add_argument("--overwrite", action="store_true", help="allow --db to be a file that already exists")
+parser.add_argument("--out", default="benchmark.json", help="where to save the results")
+args = parser.parse_args()
+# a synthetic round played on top of a real contest would wipe its responses and archive fake results
+if args.db is not None and os.path.exists(args.db) and os.path.getsize(args.db) > 0 and not args.overwrite:
+    sys.exit("Error: {:s} already exists. Pass --overwrite to wipe it.".format(args.db))
+
+report = run(args.contestants, args.responses, args.voters, args.votes, args.screen_size, args.seed, args.db)
+print("\n".join(formatReport(report)))
+with open(args.out, "w") as f:
+    json.dump(report, f, indent=2)
+print("Saved to {:s}".format(args.out))
@@ -0,0 +1,154 @@
+"""
+Bulk import and export of contest data as CSV or JSON lines, one row per line.
+Imports are written with chunked executemany in a single transaction, so a bad row leaves the database untouched.
+Exports stream straight from the cursor, so memory use doesn't grow with the table.
+Configured through bulkConfig:
+    chunkSize: rows per executemany, 5000 by default
+"""
+from ..general import sqlutils, normalize, standings
+from ...generic.utils import data
+import csv
+import json
+import itertools
+import sqlite3
+import logging
+from typing import Dict, Iterable, Iterator, TextIO, Tuple, Union
+sql_logger = logging.getLogger("sqlite3")
+formats = ("csv", "jsonl")
+
+# name -> (table, key columns, other columns with their defaults)
+importable = {
+    "contestants": ("Contestants", ("uid",), {"alive": 1, "allowedResponseCount": 1, "responseCount": 0, "prized": 0}),
+    "members": ("Members", ("uid",), {"aggregateVoteCount": 0, "roundVoteCount": 0, "remindStart": None, "remindInterval": None}),
+    "responses": ("Responses", ("uid", "rid"), {"response": None, "wordCount": None, "contentHash": None}),
+}
+# name -> {board: column index}, for the standings boards an import changes
+boards = {
+    "contestants": {"prized": 4},
+    "members": {"aggregate": 1, "round": 2},
+}
+# name -> query
+exportable = {
+    "contestants": "SELECT uid, alive, allowedResponseCount, responseCount, prized FROM Contestants ORDER BY uid;",
+    "members": "SELECT uid, aggregateVoteCount, roundVoteCount, remindStart, remindInterval FROM Members ORDER BY uid;",
+    "responses": "SELECT uid, rid, response, confirmedVoteCount FROM Responses ORDER BY uid, rid;",
+    "archive": "SELECT roundNum, rank, id, uid, rid, response, score, skew FROM ResponseArchive ORDER BY roundNum, rank;",
+}
+
+def formatOf(path: str) -> str:
+    return "jsonl" if path.endswith((".jsonl", ".json")) else "csv"
+
+def readRows(stream: TextIO, fmt: str) -> Iterator[dict]:
+    if fmt == "csv":
+        # empty cells are missing values, not empty strings
+        for row in csv.DictReader(stream):
+            yield {k: v for k, v in row.items() if k is not None and v != ""}
+    else:
+        for num, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError("Line {:d}: {:s}".format(num, e.msg))
+
+def toInt(value) -> int:
+    if isinstance(value, bool) or value is None:
+        raise ValueError("{!r} is not an integer".format(value))
+    return int(value)
+
+def prepare(table: str, rows: Iterable[dict]) -> Iterator[tuple]:
+    """ Orders each row's values to match the table's columns, filling in defaults and checking types.
+    """
+    _, keys, defaults = importable[table]
+    for line, row in enumerate(rows, 1):
+        try:
+            values = [toInt(row[k]) for k in keys]
+            for column, default in defaults.items():
+                value = row.get(column, default)
+                values.append(value if value is None or column == "response" else toInt(value))
+        except (KeyError, ValueError, TypeError) as e:
+            raise ValueError("Row {:d}: {:s}".format(line, str(e) if not isinstance(e, KeyError) else "missing " + str(e)))
+        if table == "responses":
+            # stored the same way respond stores them
+            response = normalize.normalize(str(values[2] or ""))
+            values[2:5] = [response, normalize.wordCount(response), normalize.contentHash(response)]
+        yield tuple(values)
+
+@sqlutils.handleSQLErrors
+def importRows(conn: sqlite3.Connection, table: str, rows: Iterable[dict]) -> int:
+    """ Inserts rows into table, replacing any with the same key. Returns how many were imported.
+        Raises ValueError for a malformed row, after rolling back everything imported before it.
+    """
+    name, keys, defaults = importable[table]
+    columns = list(keys) + list(defaults)
+    query = "INSERT INTO {:s} ({:s}) VALUES ({:s}) ON CONFLICT({:s}) DO UPDATE SET {:s};".format(
+        name, ", ".join(columns), ", ".join("?" * len(columns)), ", ".join(keys),
+        ", ".join("{0:s} = excluded.{0:s}".format(c) for c in defaults))
+    chunkSize = data.get("bulkConfig", {}).get("chunkSize", 5000)
+    prepared = prepare(table, rows)
+    scores = {board: {} for board in boards.get(table, {})}
+    count = 0
+    while True:
+        chunk = list(itertools.islice(prepared, chunkSize))
+        if not chunk:
+            break
+        conn.executemany(query, chunk)
+        for board, column in boards.get(table, {}).items():
+            scores[board].update((row[0], row[column]) for row in chunk)
+        count += len(chunk)
+        sql_logger.debug("Imported %d rows into %s", count, name)
+    if table == "responses":
+        sqlutils.countResponses(conn)
+    # imported rows replace what was there, so their scores do too
+    for board, values in scores.items():
+        standings.setScores(conn, board, values)
+    sql_logger.info("Imported %d rows into %s", count, name)
+    return count
+
+def importFile(conn: sqlite3.Connection, table: str, stream: TextIO, fmt: str) -> Union[int, Tuple[int, str]]:
+    """ Imports a whole file in one transaction. Returns the number of rows imported, or an error.
+    """
+    if table not in importable:
+        return (2, "Can only import {:s}.".format(", ".join(importable)))
+    if fmt not in formats:
+        return (2, "Unknown format {:s}.".format(fmt))
+    try:
+        return importRows(conn, table, readRows(stream, fmt))
+    except ValueError as e:
+        return (2, str(e))
+
+def exportRows(conn: sqlite3.Connection, table: str) -> Iterator[Dict[str, object]]:
+    """ Rows of table as they're read from the cursor.
+    """
+    cursor = conn.execute(exportable[table])
+    columns = [d[0] for d in cursor.description]
+    for row in cursor:
+        yield dict(zip(columns, row))
+
+def exportFile(conn: sqlite3.Connection, table: str, stream: TextIO, fmt: str) -> Union[int, Tuple[int, str]]:
+    """ Writes table to stream a row at a time. Returns the number of rows written, or an error.
+    """
+    if table not in exportable:
+        return (2, "Can only export {:s}.".format(", ".join(exportable)))
+    if fmt not in formats:
+        return (2, "Unknown format {:s}.".format(fmt))
+    count = 0
+    try:
+        rows = exportRows(conn, table)
+        if fmt == "csv":
+            writer = None
+            for row in rows:
+                if writer is None:
+                    writer = csv.DictWriter(stream, fieldnames=list(row))
+                    writer.writeheader()
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in rows:
+                stream.write(json.dumps(row, ensure_ascii=False) + "\n")
+                count += 1
+    except sqlite3.Error as e:
+        sql_logger.error("%s", e)
+        return (2, "SQL Error occurred.")
+    sql_logger.info("Exported %d rows of %s", count, table)
+    return count
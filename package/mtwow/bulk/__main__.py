@@ -0,0 +1,32 @@
+"""
+python -m package.mtwow.bulk import|export TABLE FILE [options]
+Imports a CSV or JSON lines file into a contest database, or exports a table from one.
+"""
+from . import importFile, exportFile, formatOf, importable, exportable
+from ..general import sqlutils
+import argparse
+import sys
+
+parser = argparse.ArgumentParser(description="Bulk import or export mtwow contest data.")
+parser.add_argument("action", choices=("import", "export"))
+parser.add_argument("table", choices=sorted(set(importable) | set(exportable)))
+parser.add_argument("file", help="file to read or write, - for stdin or stdout")
+parser.add_argument("--db", default="./package/mtwow/data.db", help="contest database")
+parser.add_argument("--format", choices=("csv", "jsonl"), default=None, help="guessed from the file name if not given")
+args = parser.parse_args()
+
+fmt = args.format or formatOf(args.file)
+conn = sqlutils.connect(args.db, readOnly=args.action == "export")
+try:
+    if args.action == "import":
+        sqlutils.init(conn)
+        with (sys.stdin if args.file == "-" else open(args.file, newline="", encoding="utf-8")) as f:
+            res = importFile(conn, args.table, f, fmt)
+    else:
+        with (sys.stdout if args.file == "-" else open(args.file, "w", newline="", encoding="utf-8")) as f:
+            res = exportFile(conn, args.table, f, fmt)
+finally:
+    sqlutils.close(conn)
+if isinstance(res, tuple):
+    sys.exit("Error: " + res[1])
+print("{:s}ed {:d} rows of {:s}".format(args.action.capitalize(), res, args.table), file=sys.stderr)
@@ -1,47 +1,313 @@
 from discord.ext import commands
-from ..general import sqlutils, admin
+import discord
+from ..general import sqlutils, admin, user, compute, scheduler, reminders, sqltrace, results, standings, contests
+from ..general.asyncdb import AsyncDatabase
 from ...generic.utils import parse_time, data
+from ...generic import web, runtime, metrics
+from .. import bulk
+import asyncio
+import io
+import os
 import sqlite3
+import tempfile
 import logging
-import atexit
-conn = sqlite3.Connection("./package/mtwow/data.db")
+from typing import Awaitable, Callable, Optional
 discord_logger = logging.getLogger("discord")
+# These live in the bot's runtime and are only looked up here by setup,
+# so reloading this extension keeps the same databases, timers and tasks.
+registry = None
+timers = None
+dispatcher = None
+# contest name -> task loading it
+loading = {}
+# tasks nothing else waits on. The event loop only keeps weak references to tasks, so these are kept here until they finish.
+background = set()
+
+def inBackground(coro) -> asyncio.Future:
+    task = asyncio.ensure_future(coro)
+    background.add(task)
+    task.add_done_callback(background.discard)
+    return task
+
+async def load(contest: contests.Contest, init: bool = False):
+    """ Opens a contest's database, catches it up and starts its timers. Does nothing if it's already loaded.
+        Everything that touches the database runs on its thread, since catching up can end a whole round.
+    """
+    task = loading.get(contest.name)
+    if task is None or (task.done() and contest.db is None):
+        # commands arriving while a contest loads all wait on the same load
+        task = loading[contest.name] = asyncio.ensure_future(start(contest, init))
+    await task
+
+async def start(contest: contests.Contest, init: bool):
+    if contest.db is not None:
+        return
+    db = contest.open()
+    if init:
+        await db.call(sqlutils.init)
+    await db.call(sqlutils.migrate)
+    # deadlines are stored as absolute times, so all that's left to do after downtime is end anything overdue
+    await db.call(admin.catchUp)
+    await db.call(standings.load)
+    # served by the web server main starts on portNum
+    results.ResultsSite(db, resultsPrefix(contest)).register()
+    await scheduleDeadline(contest)
+    await scheduleReminders(contest)
+    discord_logger.info("Loaded contest %s", contest.name)
+
+def resultsPrefix(contest: contests.Contest) -> str:
+    return "/results" if contest.name == contests.defaultName else "/results/" + contest.name
+
+def stop(contest: contests.Contest):
+    timers.cancel(contest.timer("deadline"))
+    timers.cancel(contest.timer("reminders"))
+    web.unroute(resultsPrefix(contest))
+
+async def unload(contest: contests.Contest):
+    stop(contest)
+    # closing flushes votes and waits for the database threads
+    await asyncio.get_event_loop().run_in_executor(None, contest.close)
+    discord_logger.info("Unloaded contest %s", contest.name)
+
+async def contestOf(ctx: commands.Context) -> Optional[contests.Contest]:
+    contest = registry.resolve(ctx.guild.id if ctx.guild is not None else None, ctx.channel.id)
+    if contest is not None:
+        await load(contest)
+    return contest
+
+async def scheduleDeadline(contest: contests.Contest):
+    if contest.db is None:
+        # unloaded before this got to run
+        return
+    try:
+        end = await contest.db.admin.deadline()
+    except sqlite3.Error as e:
+        # most likely the database hasn't been initialised yet
+        discord_logger.warning("Could not read phase deadline of %s: %s", contest.name, e)
+        return
+    if end is None:
+        timers.cancel(contest.timer("deadline"))
+    else:
+        timers.schedule(contest.timer("deadline"), end, phaseDeadline, contest)
+
+async def phaseDeadline(contest: contests.Contest):
+    ret = await contest.db.admin.end_phase()
+    if ret is not None:
+        discord_logger.error("Failed to end phase of %s: %s", contest.name, ret[1])
+    await scheduleDeadline(contest)
+
+async def scheduleReminders(contest: contests.Contest):
+    if contest.db is None:
+        # unloaded before this got to run
+        return
+    try:
+        end = await contest.db.read(reminders.nextReminder)
+    except sqlite3.Error as e:
+        discord_logger.warning("Could not read reminders of %s: %s", contest.name, e)
+        return
+    if end is None:
+        timers.cancel(contest.timer("reminders"))
+    else:
+        timers.schedule(contest.timer("reminders"), end, sendReminders, contest)
+
+async def sendReminders(contest: contests.Contest):
+    phase = await contest.db.reader.phase()
+    sent = await dispatcher.run(contest.db, "Reminder: the miniTWOW is currently in its {:s} phase.".format(phase))
+    discord_logger.info("Sent %d reminders for %s", sent, contest.name)
+    await scheduleReminders(contest)
+
+async def flushVotes():
+    # size-triggered flushes happen as votes come in; this catches batches that have waited too long
+    while True:
+        await asyncio.sleep(data["voteConfig"].get("batchDelay", 1000) / 1000)
+        await forEachLoaded("flush votes", lambda db: db.votes.flushIfDue())
+
+async def topUpScreens():
+    # new screens are made on a reader from the latest counts, so the ones handed out stay balanced
+    while True:
+        await asyncio.sleep(data["voteConfig"].get("poolInterval", 1000) / 1000)
+        await forEachLoaded("top up screen pool", lambda db: db.read(user.topUpPool))
+
+async def forEachLoaded(what: str, func: Callable[[AsyncDatabase], Awaitable]):
+    """ Runs func(db) for each loaded contest. Contests can be unloaded while this waits,
+        and one contest failing must not stop the loop calling this for the rest.
+    """
+    for contest in list(registry.loaded()):
+        db = contest.db
+        if db is None:
+            continue
+        try:
+            await func(db)
+        except Exception:
+            discord_logger.exception("Failed to %s of %s", what, contest.name)
 
 
 class MTwowAdministrator(commands.Cog):
     @commands.command(brief="Initialises database.")
     @commands.check(commands.is_owner())
     async def init(self, ctx: commands.Context):
-        sqlutils.init(conn)
+        contest = await contestOf(ctx)
+        if contest is None:
+            await ctx.send("Error: No contest runs here.")
+            return
+        await contest.db.sqlutils.init()
 
     @commands.command(brief="Wipes database.")
     @commands.check(commands.is_owner())
     async def wipe(self, ctx: commands.Context):
-        sqlutils.wipe(conn)
+        contest = await contestOf(ctx)
+        if contest is None:
+            await ctx.send("Error: No contest runs here.")
+            return
+        await contest.db.sqlutils.wipe()
 
     @commands.command(brief="Starts signups.")
     @commands.check(commands.is_owner())
     async def start_signups(self, ctx: commands.Context, time: parse_time):
-        if time[0] == 0:
-            ret = admin.start_signups(conn, time[1])
+        contest = await contestOf(ctx)
+        if contest is None:
+            await ctx.send("Error: No contest runs here.")
+        elif time[0] == 0:
+            ret = await contest.db.admin.start_signups(time[1])
             if ret is not None:
                 await ctx.send("Error: " + ret[1])
             else:
+                await scheduleDeadline(contest)
                 await ctx.send("Started signups!")
         else:
             await ctx.send("Error: " + time[1])
-    
+
+    @commands.command(brief="Creates a contest and runs it in this server, or just this channel.")
+    @commands.check(commands.is_owner())
+    async def contest_create(self, ctx: commands.Context, name: str, scope: str = "server"):
+        if ctx.guild is None:
+            await ctx.send("Error: Contests have to be created in a server.")
+            return
+        try:
+            contest = registry.create(name)
+            registry.bind(name, ctx.guild.id, ctx.channel.id if scope == "channel" else None)
+        except ValueError as e:
+            await ctx.send("Error: " + str(e))
+            return
+        await load(contest, init=True)
+        await ctx.send("Created contest {:s}.".format(name))
+
+    @commands.command(brief="Runs an existing contest in this server, or just this channel.")
+    @commands.check(commands.is_owner())
+    async def contest_bind(self, ctx: commands.Context, name: str, scope: str = "server"):
+        if ctx.guild is None:
+            await ctx.send("Error: Contests have to be bound in a server.")
+            return
+        try:
+            registry.bind(name, ctx.guild.id, ctx.channel.id if scope == "channel" else None)
+        except ValueError as e:
+            await ctx.send("Error: " + str(e))
+            return
+        await ctx.send("Contest {:s} now runs in this {:s}.".format(name, "channel" if scope == "channel" else "server"))
+
+    @commands.command(brief="Closes a contest's database until it's next used. Its timers don't run meanwhile.")
+    @commands.check(commands.is_owner())
+    async def contest_unload(self, ctx: commands.Context, name: str):
+        if name not in registry.contests:
+            await ctx.send("Error: There is no contest called {:s}.".format(name))
+            return
+        await unload(registry.contests[name])
+        await ctx.send("Unloaded contest {:s}.".format(name))
+
+    @commands.command(brief="Closes a contest for good and moves its database to the archive.")
+    @commands.check(commands.is_owner())
+    async def contest_archive(self, ctx: commands.Context, name: str):
+        if name in registry.contests and name != contests.defaultName:
+            stop(registry.contests[name])
+        try:
+            target = await asyncio.get_event_loop().run_in_executor(None, registry.archive, name)
+        except ValueError as e:
+            await ctx.send("Error: " + str(e))
+            return
+        await ctx.send("Archived contest {:s} to {:s}.".format(name, target))
+
+    @commands.command(brief="Lists contests.")
+    @commands.check(commands.is_owner())
+    async def contest_list(self, ctx: commands.Context):
+        lines = ["{:s}{:s}".format(name, " (loaded)" if contest.db is not None else "") for name, contest in sorted(registry.contests.items())]
+        await ctx.send("\n".join(lines) or "No contests.")
+
+    @commands.command(brief="Imports contestants, members or responses from an attached CSV or JSON lines file.")
+    @commands.check(commands.is_owner())
+    async def bulk_import(self, ctx: commands.Context, table: str):
+        contest = await contestOf(ctx)
+        if contest is None:
+            await ctx.send("Error: No contest runs here.")
+            return
+        if not ctx.message.attachments:
+            await ctx.send("Error: Attach the file to import.")
+            return
+        attachment = ctx.message.attachments[0]
+        stream = io.StringIO((await attachment.read()).decode("utf-8-sig"), newline="")
+        res = await contest.db.call(bulk.importFile, table, stream, bulk.formatOf(attachment.filename))
+        if isinstance(res, tuple):
+            await ctx.send("Error: " + res[1])
+        else:
+            await ctx.send("Imported {:d} {:s}.".format(res, table))
+
+    @commands.command(brief="Exports contestants, members, responses or the results archive as CSV or JSON lines.")
+    @commands.check(commands.is_owner())
+    async def bulk_export(self, ctx: commands.Context, table: str, fmt: str = "csv"):
+        contest = await contestOf(ctx)
+        if contest is None:
+            await ctx.send("Error: No contest runs here.")
+            return
+        # written to disk rather than memory, since the archive can be large
+        fd, path = tempfile.mkstemp(suffix="." + fmt)
+        try:
+            with open(fd, "w", newline="", encoding="utf-8") as f:
+                res = await contest.db.read(bulk.exportFile, table, f, fmt)
+            if isinstance(res, tuple):
+                await ctx.send("Error: " + res[1])
+            else:
+                await ctx.send("Exported {:d} rows.".format(res), file=discord.File(path, "{:s}-{:s}.{:s}".format(contest.name, table, fmt)))
+        finally:
+            os.remove(path)
+
+    @commands.command(brief="Shows the slowest SQL statements and call sites.")
+    @commands.check(commands.is_owner())
+    async def sql_stats(self, ctx: commands.Context, by: str = "statement"):
+        if sqltrace.sampleRate <= 0:
+            await ctx.send("SQL tracing is off. Set dbConfig.traceSampleRate to turn it on.")
+            return
+        lines = sqltrace.report(sqltrace.callSites if by == "site" else sqltrace.statements)
+        await ctx.send("```\n{:s}\n```".format("\n".join(lines) or "Nothing traced yet.")[:2000])
+
 
 def setup(bot: commands.Bot):
     discord_logger.info("Loading extension mtwow.discord.admin")
-    admin.fixTime(conn)
-    admin.setTimer(sqlutils.getDeadline(conn), admin.fixTime, args=(conn))
+    global registry, timers, dispatcher
+    rt = runtime.get(bot)
+    first = "mtwow.registry" not in rt
+    registry = rt.resource("mtwow.registry", contests.ContestRegistry, lambda r: r.closeAll(), lambda r: r.abandonAll())
+    timers = rt.resource("mtwow.timers", scheduler.Scheduler, lambda t: t.stop())
+    timers.start(bot.loop)
+
+    async def dm(uid: int, message: str):
+        member = bot.get_user(uid) or await bot.fetch_user(uid)
+        await member.send(message)
+    # people with DMs closed won't start accepting them on a retry
+    dispatcher = rt.resource("mtwow.dispatcher",
+        lambda: reminders.ReminderDispatcher(dm, lambda e: not isinstance(e, (discord.Forbidden, discord.NotFound))))
+    if first:
+        # any contest could have a deadline or reminders coming up, so they all start loaded
+        for contest in list(registry.contests.values()):
+            inBackground(bot.loop.create_task(load(contest)))
+    rt.resource("mtwow.voteFlusher", lambda: bot.loop.create_task(flushVotes()), lambda t: t.cancel())
+    # compute workers only start once a job is big enough to need them
+    rt.resource("mtwow.compute", lambda: compute, lambda c: c.shutdown())
+    rt.resource("mtwow.screenPool", lambda: bot.loop.create_task(topUpScreens()), lambda t: t.cancel())
+    metrics.registry.gauge("mtwow_screen_pool_requests", "Screens asked of the pool, by whether one was there.", user.poolStats)
+    metrics.registry.gauge("mtwow_screen_pool_available", "Screens waiting in the pool.", user.poolLevels)
     bot.add_cog(MTwowAdministrator())
-    atexit.register(admin.fixTime, args=(conn))
-    atexit.register(admin.stopTimer)
-    
+
 
 def teardown(bot: commands.Bot):
+    # databases, timers, the vote flusher and the screen pool stay in the runtime for the next setup, and are closed on shutdown
     discord_logger.info("Unloading extension mtwow.discord.admin")
     bot.remove_cog("MTwowAdministrator")
-    atexit.unregister(admin.fixTime)
\ No newline at end of file
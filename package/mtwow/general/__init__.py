@@ -1 +1 @@
-from . import sqlutils, user, admin
\ No newline at end of file
+from . import sqlutils, sampling, normalize, compute, user, standings, votes, admin, scheduler, asyncdb, reminders, results, contests
\ No newline at end of file
@@ -1,15 +1,13 @@
 import sqlite3
-from . import sqlutils
-from typing import List, Callable
+from . import sqlutils, user, votes, standings
+from typing import List, Callable, Optional
 from ...generic.utils import data, parse_time
 import logging
 import time
-import threading
 sql_logger = logging.getLogger("sqlite3")
-timer = None
 @sqlutils.handleSQLErrors
 def start_signups(conn: sqlite3.Connection, t: int):
-    sql_logger.debug("Starting signups with deadline in {:d} ms".format(t))
+    sql_logger.debug("Starting signups with deadline in %d ms", t)
     sqlutils.setPhase(conn, "signups")
     sqlutils.setDeadline(conn, t)
     sqlutils.setStartTime(conn, time.time_ns() // 1000000)
@@ -17,54 +15,84 @@ def start_signups(conn: sqlite3.Connection, t: int):
 @sqlutils.handleSQLErrors
 def start_responding(conn: sqlite3.Connection, defaultResponseCount: int, t: int, prompt: str):
     if defaultResponseCount is None: defaultResponseCount = 1
-    sqlutils.setPhase(conn, "responding")
-    sqlutils.setPrompt(conn, prompt)
-    sqlutils.setStartTime(conn, time.time_ns())
-    sqlutils.setDeadline(conn, t)
+    status = {"phase": "responding", "prompt": prompt, "startTime": time.time_ns() // 1000000, "deadline": t}
+    # the last round's results are archived by now, so this is the next one
+    if sqlutils.phase(conn) == "results":
+        status["roundNum"] = sqlutils.roundNum(conn) + 1
+    sqlutils.updateStatus(conn, status)
     sqlutils.wipeAllResponses(conn)
     sqlutils.setAllResponseCount(conn, defaultResponseCount)
 
+# Each phase change is an undecorated function wrapped by a handleSQLErrors one. Phase changes made of others call
+# the undecorated ones, since a nested handleSQLErrors would commit partway through, and a later failure couldn't roll it all back.
 @sqlutils.handleSQLErrors
 def end_responding(conn: sqlite3.Connection):
-    contestants = sqlutils.getAllContestants(conn)
-    for contestant in contestants:
-        if contestant["responseCount"] == 0:
-            sqlutils.killContestant(conn, contestant["uid"])
+    endResponding(conn)
+
+def endResponding(conn: sqlite3.Connection):
+    sqlutils.countResponses(conn)
+    sqlutils.killNonResponders(conn)
+
+def deadline(conn: sqlite3.Connection) -> Optional[int]:
+    """ Absolute deadline of the current phase in ms since epoch, or None if it doesn't have one.
+    """
+    if sqlutils.getDeadline(conn) < 0:
+        return None
+    return sqlutils.getTime(conn) + sqlutils.getDeadline(conn)
 
 @sqlutils.handleSQLErrors
-def fixTime(conn: sqlite3.Connection):
-    deadline = sqlutils.getDeadline(conn)
-    stime = sqlutils.getTime(conn)
-    ctime = time.time_ns() // 1000000
-    deadline -= ctime - stime
+def end_phase(conn: sqlite3.Connection):
+    return endPhase(conn)
+
+def endPhase(conn: sqlite3.Connection):
     phase = sqlutils.phase(conn)
-    if deadline <= 0: 
-        if phase == "responding":
-            end_responding(conn)
-        elif phase == "signups":
-            end_signups(conn)
-        elif phase == "voting":
-            end_voting(conn)
-    else:
-        sqlutils.setDeadline(conn, deadline)
-        sqlutils.setStartTime(conn, ctime)
+    # the deadline has been dealt with, so don't end this phase again on the next catch-up
+    sqlutils.setDeadline(conn, -1)
+    if phase == "responding":
+        return endResponding(conn)
+    elif phase == "signups":
+        return endSignups(conn)
+    elif phase == "voting":
+        return endVoting(conn)
 
 @sqlutils.handleSQLErrors
-def start_voting(conn):
-    pass
+def catchUp(conn: sqlite3.Connection):
+    """ Ends the current phase if its deadline passed while the bot was down.
+    """
+    end = deadline(conn)
+    if end is not None and end <= time.time_ns() // 1000000:
+        return endPhase(conn)
+
+@sqlutils.handleSQLErrors
+def start_voting(conn: sqlite3.Connection, t: int = -1, screenSizes: List[int] = None):
+    """ screenSizes are the sizes of screen to keep ready in the pool, voteConfig.screenSizes by default.
+    """
+    sqlutils.updateStatus(conn, {"phase": "voting", "startTime": time.time_ns() // 1000000, "deadline": t})
+    with user.screenCacheLock:
+        user.screenCache.clear()
+    user.warmPool(conn, screenSizes or data["voteConfig"].get("screenSizes", [10]))
 
 @sqlutils.handleSQLErrors
 def end_voting(conn: sqlite3.Connection):
-    pass
+    return endVoting(conn)
+
+def endVoting(conn: sqlite3.Connection):
+    # anything still buffered has to be in Votes before the round is scored
+    with votes.buffered(conn):
+        # these pull in NumPy, which is the slowest import by far, so they wait until a round is actually scored
+        from . import scoring, history
+        scoring.scoreRound(conn)
+        # files can't be rolled back, so they're only written once the round is safely archived
+        sqlutils.afterCommit(conn, history.exportPending)
+        # everything worth keeping is in ResponseArchive now
+        sqlutils.clearRound(conn)
+        user.dropPool(conn)
+        standings.resetRound(conn)
+        sqlutils.setPhase(conn, "results")
 
 @sqlutils.handleSQLErrors
 def end_signups(conn: sqlite3.Connection):
-    pass
-
-def setTimer(ms: int, func: Callable, *args, **kwargs):
-    timer = threading.Timer(ms / 1000, func, *args, **kwargs)
-    timer.start()
+    endSignups(conn)
 
-def stopTimer():
-    if timer is not None:
-        timer.cancel()
\ No newline at end of file
+def endSignups(conn: sqlite3.Connection):
+    pass
@@ -0,0 +1,82 @@
+"""
+Runs database work off the event loop.
+"""
+from . import sqlutils, user, admin, votes
+from ...generic.utils import data
+import asyncio
+import concurrent.futures
+import functools
+import threading
+import logging
+from typing import Callable
+sql_logger = logging.getLogger("sqlite3")
+
+class ModuleProxy:
+    """ Exposes every function of a module as an awaitable that runs on a database thread.
+        await db.user.signup(uid) is the same as user.signup(conn, uid), minus the blocking.
+    """
+    def __init__(self, call: Callable, module):
+        self.call = call
+        self.module = module
+
+    def __getattr__(self, name: str) -> Callable:
+        return functools.partial(self.call, getattr(self.module, name))
+
+class AsyncDatabase:
+    """ Owns a connection that is only ever touched by a single worker thread.
+        Calls are queued to that thread in order, so each handleSQLErrors transaction
+        still runs start to finish without anything else interleaving with it.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="mtwow-db", initializer=self.connect)
+        # Read-only connections, one per reader thread. WAL mode means these never wait on the writer.
+        self.local = threading.local()
+        self.readConns = []
+        self.readers = concurrent.futures.ThreadPoolExecutor(max_workers=data.get("dbConfig", {}).get("readers", 4), thread_name_prefix="mtwow-db-read")
+        self.sqlutils = ModuleProxy(self.call, sqlutils)
+        self.user = ModuleProxy(self.call, user)
+        self.admin = ModuleProxy(self.call, admin)
+        self.votes = ModuleProxy(self.call, votes)
+        self.reader = ModuleProxy(self.read, sqlutils)
+
+    def connect(self):
+        self.conn = sqlutils.connect(self.path)
+
+    def run(self, func: Callable, args: tuple, kwargs: dict):
+        return func(self.conn, *args, **kwargs)
+
+    def runRead(self, func: Callable, args: tuple, kwargs: dict):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = self.local.conn = sqlutils.connect(self.path, readOnly=True)
+            self.readConns.append(conn)
+        return func(conn, *args, **kwargs)
+
+    def submit(self, func: Callable, *args, **kwargs) -> concurrent.futures.Future:
+        """ Queues func(conn, *args, **kwargs) on the database thread. Safe to call from any thread.
+        """
+        return self.executor.submit(self.run, func, args, kwargs)
+
+    async def call(self, func: Callable, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(func, *args, **kwargs))
+
+    async def read(self, func: Callable, *args, **kwargs):
+        """ Runs func(conn, *args, **kwargs) on a read-only connection. func must not write.
+        """
+        return await asyncio.wrap_future(self.readers.submit(self.runRead, func, args, kwargs))
+
+    def callSync(self, func: Callable, *args, **kwargs):
+        """ Blocks until the call is done. Only for use outside the event loop, e.g. setup or atexit.
+        """
+        return self.submit(func, *args, **kwargs).result()
+
+    def close(self):
+        self.readers.shutdown(wait=True)
+        for conn in self.readConns:
+            sqlutils.close(conn)
+        self.readConns = []
+        if self.conn is not None:
+            self.executor.submit(lambda: sqlutils.close(self.conn)).result()
+        self.executor.shutdown(wait=True)
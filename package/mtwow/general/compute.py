@@ -0,0 +1,65 @@
+"""
+Runs CPU-heavy contest work in worker processes, so it doesn't hold the GIL the event loop needs.
+Jobs take compact snapshots, typed arrays and packed strings, and give back arrays that the caller
+applies in its own transaction. Small jobs run inline, since shipping them to a worker costs more than it saves.
+Configured through computeConfig:
+    workers: worker processes, 2 by default, or 0 to run everything inline
+    inlineBelow: jobs smaller than this run inline, 20000 by default
+"""
+from ...generic.utils import data
+import array
+import concurrent.futures
+import concurrent.futures.process
+import itertools
+import multiprocessing
+import threading
+import logging
+from typing import Callable, List, Tuple
+sql_logger = logging.getLogger("sqlite3")
+executor = None
+executorLock = threading.Lock()
+
+def pool() -> concurrent.futures.ProcessPoolExecutor:
+    global executor
+    with executorLock:
+        if executor is None:
+            workers = data.get("computeConfig", {}).get("workers", 2)
+            sql_logger.info("Starting %d compute workers", workers)
+            # forking would copy the database threads' locks mid-use, so workers start clean
+            executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return executor
+
+def inline(size: int) -> bool:
+    """ Whether a job of this size runs inline. Callers can check first and skip packing a snapshot.
+    """
+    config = data.get("computeConfig", {})
+    return config.get("workers", 2) <= 0 or size < config.get("inlineBelow", 20000)
+
+def run(func: Callable, size: int, *args):
+    """ func(*args) in a worker, or inline if inline(size).
+        func and its arguments have to be picklable, so func must be a module-level function.
+    """
+    if inline(size):
+        return func(*args)
+    try:
+        return pool().submit(func, *args).result()
+    except concurrent.futures.process.BrokenProcessPool:
+        # a worker died, most likely killed for memory; the next job gets a fresh pool
+        sql_logger.error("Compute worker died, running %s inline", func.__name__)
+        shutdown()
+        return func(*args)
+
+def shutdown():
+    global executor
+    with executorLock:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+            executor = None
+
+def packStrings(strings: List[str]) -> Tuple[str, array.array]:
+    """ One string and the offsets of each piece in it, which pickle far smaller and faster than a list.
+    """
+    return ("".join(strings), array.array("q", itertools.accumulate(map(len, strings), initial=0)))
+
+def unpackStrings(joined: str, offsets: array.array) -> List[str]:
+    return [joined[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
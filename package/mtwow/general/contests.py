@@ -0,0 +1,173 @@
+"""
+Runs several contests from one process, each in its own SQLite file with its own AsyncDatabase.
+A contest is bound to a guild, or to a single channel of one, and commands go to the contest bound to where they were sent.
+Configured through contestConfig:
+    directory: where contest databases and the registry live, ./package/mtwow/contests by default
+    default: database file of the contest used where nothing else is bound, ./package/mtwow/data.db by default, or null for none
+"""
+from . import sqlutils, votes
+from .asyncdb import AsyncDatabase
+from ...generic.utils import data
+import json
+import os
+import re
+import threading
+import time
+import logging
+from typing import List, Optional
+sql_logger = logging.getLogger("sqlite3")
+defaultName = "default"
+validName = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+class Contest:
+    def __init__(self, name: str, path: str):
+        self.name = name
+        self.path = path
+        self.db = None
+
+    def open(self) -> AsyncDatabase:
+        if self.db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.db = AsyncDatabase(self.path)
+        return self.db
+
+    def close(self):
+        """ Writes out buffered votes and closes the database, forgetting everything cached about it.
+        """
+        if self.db is not None:
+            try:
+                ret = self.db.callSync(votes.flushVotes)
+                if ret is not None:
+                    sql_logger.error("Failed to flush votes of %s: %s", self.name, ret[1])
+            finally:
+                self.db.close()
+                self.db = None
+                sqlutils.dropCaches(self.path)
+
+    def abandon(self):
+        """ Writes out buffered votes on a connection of its own. For when the process is exiting
+            and the database threads are already gone, so nothing else is writing.
+        """
+        if self.db is not None:
+            conn = sqlutils.connect(self.path)
+            try:
+                ret = votes.flushVotes(conn)
+                if ret is not None:
+                    sql_logger.error("Failed to flush votes of %s: %s", self.name, ret[1])
+            finally:
+                sqlutils.close(conn)
+
+    def timer(self, name: str) -> str:
+        """ Scheduler name of one of this contest's timers, so contests sharing a scheduler don't collide.
+        """
+        return "{:s}:{:s}".format(self.name, name)
+
+class ContestRegistry:
+    """ Maps guilds and channels to contests. The mapping is kept in registry.json in the contest directory.
+        Databases are only opened when a contest is loaded, and each has its own writer thread and file lock,
+        so contests never wait on each other.
+    """
+    def __init__(self):
+        config = data.get("contestConfig", {})
+        self.directory = config.get("directory", "./package/mtwow/contests")
+        self.registryPath = os.path.join(self.directory, "registry.json")
+        # contest name -> Contest
+        self.contests = {}
+        # "guild" or "guild:channel" -> contest name
+        self.bindings = {}
+        self.lock = threading.Lock()
+        default = config.get("default", "./package/mtwow/data.db")
+        if default is not None:
+            self.contests[defaultName] = Contest(defaultName, default)
+        if os.path.exists(self.registryPath):
+            with open(self.registryPath) as f:
+                registry = json.load(f)
+            for name in registry["contests"]:
+                self.contests[name] = Contest(name, self.pathOf(name))
+            self.bindings = registry["bindings"]
+
+    def pathOf(self, name: str) -> str:
+        return os.path.join(self.directory, name + ".db")
+
+    def save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        registry = {"contests": sorted(name for name in self.contests if name != defaultName), "bindings": self.bindings}
+        # write and swap, so a crash can't leave half a registry behind
+        with open(self.registryPath + ".tmp", "w") as f:
+            json.dump(registry, f, indent=4)
+        os.replace(self.registryPath + ".tmp", self.registryPath)
+
+    def resolve(self, guild: Optional[int], channel: Optional[int]) -> Optional[Contest]:
+        """ The contest for a message sent in channel of guild: the channel's, else the guild's, else the default.
+        """
+        name = None
+        if guild is not None:
+            name = self.bindings.get("{:d}:{:d}".format(guild, channel)) if channel is not None else None
+            name = name or self.bindings.get(str(guild))
+        return self.contests.get(name or defaultName)
+
+    def create(self, name: str) -> Contest:
+        if not validName.match(name):
+            raise ValueError("Contest names may only use letters, digits, - and _.")
+        with self.lock:
+            if name in self.contests:
+                raise ValueError("There is already a contest called {:s}.".format(name))
+            contest = self.contests[name] = Contest(name, self.pathOf(name))
+            self.save()
+        sql_logger.info("Created contest %s at %s", name, contest.path)
+        return contest
+
+    def bind(self, name: str, guild: int, channel: Optional[int] = None):
+        with self.lock:
+            if name not in self.contests:
+                raise ValueError("There is no contest called {:s}.".format(name))
+            self.bindings["{:d}:{:d}".format(guild, channel) if channel is not None else str(guild)] = name
+            self.save()
+
+    def unbind(self, guild: int, channel: Optional[int] = None):
+        with self.lock:
+            self.bindings.pop("{:d}:{:d}".format(guild, channel) if channel is not None else str(guild), None)
+            self.save()
+
+    def loaded(self) -> List[Contest]:
+        return [contest for contest in self.contests.values() if contest.db is not None]
+
+    def archive(self, name: str) -> str:
+        """ Closes a contest, unbinds it and moves its database into the archive directory. Returns where it went.
+        """
+        with self.lock:
+            if name not in self.contests or name == defaultName:
+                raise ValueError("There is no contest called {:s} that can be archived.".format(name))
+            contest = self.contests.pop(name)
+            contest.close()
+            self.bindings = {k: v for k, v in self.bindings.items() if v != name}
+            self.save()
+        target = os.path.join(self.directory, "archive", "{:s}-{:d}.db".format(name, time.time_ns() // 1000000))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if os.path.exists(contest.path):
+            os.replace(contest.path, target)
+            # WAL files are left empty by a clean close, but don't leave them lying around
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(contest.path + suffix):
+                    os.remove(contest.path + suffix)
+        # columnar round exports go along with it, see history
+        rounds = os.path.splitext(contest.path)[0] + ".archive"
+        if os.path.isdir(rounds):
+            os.replace(rounds, os.path.splitext(target)[0] + ".archive")
+        sql_logger.info("Archived contest %s to %s", name, target)
+        return target
+
+    def closeAll(self):
+        # one contest failing to close mustn't leave the rest open
+        for contest in self.loaded():
+            try:
+                contest.close()
+            except Exception:
+                sql_logger.exception("Failed to close contest %s", contest.name)
+
+    def abandonAll(self):
+        for contest in self.loaded():
+            try:
+                contest.abandon()
+            except Exception:
+                sql_logger.exception("Failed to save contest %s", contest.name)
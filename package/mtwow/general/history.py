@@ -0,0 +1,193 @@
+"""
+Columnar archive of finished rounds, for stats across rounds without scanning ResponseArchive.
+Each round is written once to its own directory next to the database:
+    <database>.archive/round-00001/
+        id.npy, uid.npy, rid.npy, rank.npy, score.npy, skew.npy    one value per response, best rank first
+        text.bin, offsets.npy                                      response i is text.bin[offsets[i]:offsets[i + 1]] in UTF-8
+        meta.json                                                  round number, prompt and response count
+Rounds are memory mapped on first use, so queries read straight from the page cache.
+Configured through archiveConfig:
+    prune: delete a round's ResponseArchive rows once it has been exported, false by default
+"""
+from . import sqlutils
+from ...generic.utils import data
+import numpy as np
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import logging
+from typing import Dict, List, Optional
+sql_logger = logging.getLogger("sqlite3")
+columns = {"id": np.int64, "uid": np.int64, "rid": np.int32, "rank": np.int32, "score": np.float64, "skew": np.float64}
+
+def archiveDirectory(conn: sqlite3.Connection) -> Optional[str]:
+    path = sqlutils.databaseKey(conn)
+    if not isinstance(path, str) or path == ":memory:":
+        return None
+    return os.path.splitext(path)[0] + ".archive"
+
+def roundDirectory(directory: str, roundNum: int) -> str:
+    return os.path.join(directory, "round-{:05d}".format(roundNum))
+
+def exportRound(conn: sqlite3.Connection, directory: str, roundNum: int):
+    rows = conn.execute("SELECT id, uid, rid, rank, score, skew, response FROM ResponseArchive WHERE roundNum = ? ORDER BY rank;",
+        (roundNum,)).fetchall()
+    prompt = conn.execute("SELECT prompt FROM Rounds WHERE roundNum = ?;", (roundNum,)).fetchone()
+    sql_logger.info("Exporting %d responses of round %d to %s", len(rows), roundNum, directory)
+    target = roundDirectory(directory, roundNum)
+    # written to the side and swapped in, so readers never see half a round
+    tmp = target + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for i, (name, dtype) in enumerate(columns.items()):
+        np.save(os.path.join(tmp, name + ".npy"), np.array([row[i] for row in rows], dtype=dtype))
+    text = [(row["response"] or "").encode("utf-8") for row in rows]
+    np.save(os.path.join(tmp, "offsets.npy"), np.concatenate(([0], np.cumsum([len(t) for t in text], dtype=np.int64))).astype(np.int64))
+    with open(os.path.join(tmp, "text.bin"), "wb") as f:
+        f.write(b"".join(text))
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({"round": roundNum, "prompt": prompt[0] if prompt else None, "count": len(rows)}, f)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+
+def exportPending(conn: sqlite3.Connection) -> List[int]:
+    """ Exports every round in ResponseArchive that hasn't been exported yet, and prunes it if archiveConfig.prune is set.
+        Returns the rounds exported.
+    """
+    directory = archiveDirectory(conn)
+    if directory is None:
+        return []
+    done = []
+    prune = data.get("archiveConfig", {}).get("prune", False)
+    for (roundNum,) in conn.execute("SELECT DISTINCT roundNum FROM ResponseArchive ORDER BY roundNum;").fetchall():
+        if not os.path.exists(roundDirectory(directory, roundNum)):
+            exportRound(conn, directory, roundNum)
+            done.append(roundNum)
+        if prune:
+            conn.execute("DELETE FROM ResponseArchive WHERE roundNum = ?;", (roundNum,))
+    if done:
+        invalidate(directory)
+    return done
+
+def discard(conn: sqlite3.Connection):
+    """ Moves the exported rounds of a wiped database aside, so the next contest's rounds are exported rather than skipped.
+    """
+    directory = archiveDirectory(conn)
+    if directory is None:
+        return
+    if os.path.isdir(directory):
+        target = "{:s}.wiped-{:d}".format(directory, time.time_ns() // 1000000)
+        os.replace(directory, target)
+        sql_logger.info("Moved exported rounds of the wiped database to %s", target)
+    invalidate(directory)
+
+class RoundColumns:
+    """ One exported round, memory mapped. Columns are NumPy arrays in rank order.
+    """
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        self.roundNum = meta["round"]
+        self.prompt = meta["prompt"]
+        self.count = meta["count"]
+        self.columns = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in columns}
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode="r")
+        size = os.path.getsize(os.path.join(path, "text.bin"))
+        # np.memmap can't map an empty file
+        self.text = np.memmap(os.path.join(path, "text.bin"), dtype=np.uint8, mode="r") if size else np.zeros(0, dtype=np.uint8)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def response(self, i: int) -> str:
+        return bytes(self.text[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+class Archive:
+    """ Every exported round of one database. Rounds are opened on first use and kept open.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        # round number -> RoundColumns
+        self.opened = {}
+        self.lock = threading.Lock()
+
+    def rounds(self) -> List[int]:
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(int(name[6:]) for name in os.listdir(self.directory) if name.startswith("round-") and not name.endswith(".tmp"))
+
+    def round(self, roundNum: int) -> Optional[RoundColumns]:
+        with self.lock:
+            if roundNum not in self.opened:
+                path = roundDirectory(self.directory, roundNum)
+                if not os.path.isdir(path):
+                    return None
+                self.opened[roundNum] = RoundColumns(path)
+            return self.opened[roundNum]
+
+    def contestant(self, uid: int) -> Optional[dict]:
+        """ A contestant's record over every exported round, from their best response in each.
+            percentile is 1 for first place and 0 for last.
+        """
+        ranks = []
+        for roundNum in self.rounds():
+            columns = self.round(roundNum)
+            mine = np.flatnonzero(columns["uid"] == uid)
+            if len(mine):
+                # rows are in rank order, so the first one is the best
+                best = mine[0]
+                ranks.append((roundNum, int(columns["rank"][best]), columns.count, float(columns["score"][best])))
+        if not ranks:
+            return None
+        rank = np.array([r[1] for r in ranks], dtype=np.float64)
+        count = np.array([r[2] for r in ranks], dtype=np.float64)
+        percentile = np.where(count > 1, 1 - (rank - 1) / np.maximum(count - 1, 1), 1.0)
+        best = int(np.argmax(percentile))
+        return {
+            "rounds": len(ranks),
+            "meanRank": float(rank.mean()),
+            "meanPercentile": float(percentile.mean()),
+            "meanScore": float(np.mean([r[3] for r in ranks])),
+            "bestRound": ranks[best][0],
+            "bestRank": ranks[best][1],
+            "history": [{"round": r[0], "rank": r[1], "of": r[2], "score": r[3]} for r in ranks]
+        }
+
+    def scoreDistribution(self, bins: int = 10, uid: Optional[int] = None) -> Dict[str, list]:
+        """ Histogram of scores over every exported round, of one contestant's responses or everyone's.
+        """
+        counts = np.zeros(bins, dtype=np.int64)
+        edges = np.linspace(0, 1, bins + 1)
+        for roundNum in self.rounds():
+            columns = self.round(roundNum)
+            scores = columns["score"] if uid is None else columns["score"][columns["uid"] == uid]
+            counts += np.histogram(scores, bins=edges)[0]
+        return {"edges": edges.tolist(), "counts": counts.tolist()}
+
+    def top(self, roundNum: int, n: int) -> List[dict]:
+        columns = self.round(roundNum)
+        if columns is None:
+            return []
+        return [{"rank": int(columns["rank"][i]), "uid": int(columns["uid"][i]), "response": columns.response(i), "score": float(columns["score"][i])}
+            for i in range(min(n, columns.count))]
+
+# archive directory -> Archive
+archives = {}
+archivesLock = threading.Lock()
+
+def archiveFor(conn: sqlite3.Connection) -> Optional[Archive]:
+    directory = archiveDirectory(conn)
+    if directory is None:
+        return None
+    with archivesLock:
+        if directory not in archives:
+            archives[directory] = Archive(directory)
+        return archives[directory]
+
+def invalidate(directory: str):
+    # a re-exported round has to be mapped again
+    with archivesLock:
+        archives.pop(directory, None)
@@ -0,0 +1,38 @@
+"""
+Normalizes responses before they are stored.
+Configured through responseConfig:
+    deleteChars: characters to drop, zero width spaces and newlines by default
+    replaceChars: {character: replacement}
+    unicodeForm: "NFC", "NFKC", ... to run unicodedata.normalize first, or null to skip it
+    wordLimit: the word count responses should hit, 10 by default
+"""
+from ...generic.utils import data
+import functools
+import hashlib
+import unicodedata
+from typing import Dict, Optional, Tuple
+
+@functools.lru_cache(maxsize=1)
+def pipeline() -> Tuple[Dict[int, Optional[str]], Optional[str]]:
+    """ The translate table and Unicode form, built once from responseConfig.
+        Call pipeline.cache_clear() after changing the config.
+    """
+    config = data.get("responseConfig", {})
+    table = str.maketrans(config.get("replaceChars", {}))
+    table.update(dict.fromkeys(map(ord, config.get("deleteChars", "\u200b\n"))))
+    return (table, config.get("unicodeForm"))
+
+def normalize(text: str) -> str:
+    table, form = pipeline()
+    if form:
+        text = unicodedata.normalize(form, text)
+    return text.translate(table).strip()
+
+def wordCount(text: str) -> int:
+    return len(text.split())
+
+def contentHash(text: str) -> int:
+    """ Signed 64 bit hash of a normalized response, ignoring case and spacing, so it fits an INTEGER column.
+    """
+    key = " ".join(text.casefold().split()).encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big", signed=True)
@@ -0,0 +1,109 @@
+"""
+Sends members the reminders set up through Members.remindStart and Members.remindInterval.
+remindStart is when the next reminder is due, in ms since epoch, and remindInterval is the time between reminders.
+"""
+from . import sqlutils, standings
+from ...generic.utils import data
+import asyncio
+import sqlite3
+import time
+import logging
+from typing import Awaitable, Callable, List, Optional
+sql_logger = logging.getLogger("sqlite3")
+discord_logger = logging.getLogger("discord")
+chunkSize = 500
+
+@sqlutils.handleSQLErrors
+def setReminder(conn: sqlite3.Connection, uid: int, start: Optional[int], interval: Optional[int]):
+    sql_logger.debug("Setting reminders for %d", uid)
+    conn.execute("""INSERT INTO Members (uid, remindStart, remindInterval) VALUES (?, ?, ?)
+        ON CONFLICT(uid) DO UPDATE SET remindStart = excluded.remindStart, remindInterval = excluded.remindInterval;""",
+        (uid, start, interval))
+    standings.join(conn, uid, ("aggregate", "round"))
+
+def nextReminder(conn: sqlite3.Connection) -> Optional[int]:
+    return conn.execute("SELECT MIN(remindStart) FROM Members;").fetchone()[0]
+
+def dueReminders(conn: sqlite3.Connection, now: int, limit: int) -> List[int]:
+    return [row[0] for row in conn.execute(
+        "SELECT uid FROM Members WHERE remindStart <= ? ORDER BY remindStart LIMIT ?;", (now, limit))]
+
+@sqlutils.handleSQLErrors
+def advanceReminders(conn: sqlite3.Connection, uids: List[int], now: int):
+    # Moves each reminder to its first slot after now, skipping any that were missed.
+    # Reminders without an interval are one-offs and get cleared.
+    for i in range(0, len(uids), chunkSize):
+        chunk = uids[i:i + chunkSize]
+        conn.execute("""UPDATE Members SET remindStart = CASE WHEN remindInterval > 0
+                THEN remindStart + remindInterval * ((? - remindStart) / remindInterval + 1) ELSE NULL END
+            WHERE uid IN ({:s});""".format(", ".join("?" * len(chunk))), [now] + chunk)
+
+class TokenBucket:
+    """ Allows bursts of up to capacity, refilling at rate tokens per second.
+    """
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class ReminderDispatcher:
+    """ Sends reminders through send(uid, message), which is the only part that knows about Discord.
+        Sends are rate limited, capped at a number in flight at once, and retried with exponential backoff.
+    """
+    def __init__(self, send: Callable[[int, str], Awaitable], retryable: Callable[[Exception], bool] = lambda e: True):
+        config = data.get("reminderConfig", {})
+        self.send = send
+        self.retryable = retryable
+        self.bucket = TokenBucket(config.get("rate", 5), config.get("burst", 5))
+        self.concurrency = config.get("concurrency", 10)
+        self.retries = config.get("retries", 3)
+        self.backoff = config.get("backoff", 1)
+        self.batchSize = config.get("batchSize", 200)
+
+    async def deliver(self, semaphore: asyncio.Semaphore, uid: int, message: str) -> bool:
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                await self.bucket.acquire()
+                try:
+                    await self.send(uid, message)
+                    return True
+                except Exception as e:
+                    if attempt == self.retries or not self.retryable(e):
+                        discord_logger.warning("Could not remind %d: %s", uid, e)
+                        return False
+                    await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def dispatch(self, uids: List[int], message: str) -> int:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        sent = await asyncio.gather(*[self.deliver(semaphore, uid, message) for uid in uids])
+        return sum(sent)
+
+    async def run(self, db, message: str) -> int:
+        """ Sends every reminder that is due, a batch at a time, and moves them all on to their next slot.
+            db is an AsyncDatabase. Returns how many were sent.
+        """
+        sent = 0
+        while True:
+            now = time.time_ns() // 1000000
+            uids = await db.read(dueReminders, now, self.batchSize)
+            if not uids:
+                return sent
+            sent += await self.dispatch(uids, message)
+            # failed sends move on too, otherwise one closed DM would be retried forever
+            ret = await db.call(advanceReminders, uids, now)
+            if ret is not None:
+                discord_logger.error("Failed to advance reminders: %s", ret[1])
+                return sent
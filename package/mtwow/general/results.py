@@ -0,0 +1,114 @@
+"""
+Read-only results site, served by generic.web on portNum.
+Pages are JSON built from the Leaderboard, ContestantHistory and Rounds tables, which are refreshed when a round is archived.
+Reads go through an AsyncDatabase's read-only connections, and built pages are cached in process,
+so a results reveal costs the bot at most one small query per page every cacheSeconds.
+"""
+from ...generic import web
+from ...generic.utils import data
+import email.utils
+import hashlib
+import json
+import sqlite3
+import time
+from typing import List, Optional
+
+def rounds(conn: sqlite3.Connection) -> List[dict]:
+    return [{"round": row["roundNum"], "prompt": row["prompt"], "responses": row["responseCount"], "archivedAt": row["archivedAt"]}
+        for row in conn.execute("SELECT roundNum, prompt, responseCount, archivedAt FROM Rounds ORDER BY roundNum;")]
+
+def leaderboard(conn: sqlite3.Connection, roundNum: int) -> Optional[dict]:
+    info = conn.execute("SELECT prompt, archivedAt FROM Rounds WHERE roundNum = ?;", (roundNum,)).fetchone()
+    if info is None:
+        return None
+    # user IDs are strings, since snowflakes don't fit in a JavaScript number
+    return {"round": roundNum, "prompt": info["prompt"], "archivedAt": info["archivedAt"], "results": [
+        {"rank": row["rank"], "uid": str(row["uid"]), "rid": row["rid"], "response": row["response"], "score": row["score"], "skew": row["skew"]}
+        for row in conn.execute("SELECT rank, uid, rid, response, score, skew FROM Leaderboard WHERE roundNum = ? ORDER BY rank;", (roundNum,))]}
+
+def history(conn: sqlite3.Connection, uid: int) -> Optional[dict]:
+    rows = conn.execute("""SELECT roundNum, bestRank, responseCount, meanScore, percentile FROM ContestantHistory
+        WHERE uid = ? ORDER BY roundNum;""", (uid,)).fetchall()
+    if not rows:
+        return None
+    return {"uid": str(uid), "rounds": [{"round": row["roundNum"], "bestRank": row["bestRank"], "responses": row["responseCount"],
+        "score": row["meanScore"], "percentile": row["percentile"]} for row in rows]}
+
+def lastArchived(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COALESCE(MAX(archivedAt), 0) FROM Rounds;").fetchone()[0]
+
+class Page:
+    def __init__(self, stamp: int, body: Optional[bytes]):
+        self.stamp = stamp
+        self.checked = time.monotonic()
+        self.body = body
+        if body is not None:
+            self.etag = '"{:s}"'.format(hashlib.blake2b(body, digest_size=12).hexdigest())
+            self.lastModified = email.utils.formatdate(stamp / 1000, usegmt=True)
+
+class ResultsSite:
+    """ Serves
+            /results/                  every archived round
+            /results/round/<n>         the leaderboard of round n
+            /results/contestant/<uid>  a contestant's results over every round
+        db is an AsyncDatabase; only its readers are used.
+    """
+    def __init__(self, db, prefix: str = "/results"):
+        self.db = db
+        self.prefix = prefix
+        self.cacheSeconds = data.get("resultsConfig", {}).get("cacheSeconds", 5)
+        self.cacheSize = data.get("resultsConfig", {}).get("cachePages", 4096)
+        # path -> Page
+        self.cache = {}
+
+    def register(self):
+        web.route(self.prefix, self.handle)
+
+    async def build(self, path: str) -> Optional[bytes]:
+        parts = path[len(self.prefix):].strip("/").split("/")
+        try:
+            if parts == [""]:
+                page = await self.db.read(rounds)
+            elif len(parts) == 2 and parts[0] == "round":
+                page = await self.db.read(leaderboard, int(parts[1]))
+            elif len(parts) == 2 and parts[0] == "contestant":
+                page = await self.db.read(history, int(parts[1]))
+            else:
+                return None
+        except ValueError:
+            return None
+        if page is None:
+            return None
+        return json.dumps(page, separators=(",", ":")).encode("utf-8")
+
+    async def page(self, path: str) -> Page:
+        page = self.cache.get(path)
+        if page is not None and time.monotonic() - page.checked < self.cacheSeconds:
+            return page
+        # results only change when a round is archived, so one cheap query says whether a cached page is stale
+        stamp = await self.db.read(lastArchived)
+        if page is not None and page.stamp == stamp:
+            page.checked = time.monotonic()
+            return page
+        page = Page(stamp, await self.build(path))
+        if len(self.cache) >= self.cacheSize:
+            self.cache.clear()
+        self.cache[path] = page
+        return page
+
+    async def handle(self, request: web.Request) -> web.Response:
+        page = await self.page(request.path.rstrip("/"))
+        if page.body is None:
+            return web.Response(404, b"Not found.")
+        headers = {"ETag": page.etag, "Last-Modified": page.lastModified, "Cache-Control": "public, max-age={:d}".format(self.cacheSeconds)}
+        if "if-none-match" in request.headers:
+            notModified = page.etag in request.headers["if-none-match"] or request.headers["if-none-match"].strip() == "*"
+        else:
+            since = request.headers.get("if-modified-since")
+            try:
+                notModified = since is not None and email.utils.parsedate_to_datetime(since).timestamp() >= page.stamp // 1000
+            except (TypeError, ValueError):
+                notModified = False
+        if notModified:
+            return web.Response(304, headers=headers)
+        return web.Response(200, page.body, "application/json", headers)
@@ -0,0 +1,92 @@
+"""
+Weighted random sampling without replacement, used to build voting screens.
+"""
+import random
+from typing import List, Iterable, Callable
+
+class FenwickSampler:
+    """ Fenwick tree over a list of weights.
+        Drawing an index is O(log n), and drawn indices are zeroed out so they can't be drawn again.
+        Call restore() to put every drawn weight back, so one tree can serve many screens.
+    """
+    def __init__(self, weights: Iterable[float], rand: Callable[[], float] = random.random):
+        self.weights = [float(w) for w in weights]
+        self.size = len(self.weights)
+        self.rand = rand
+        self.removed = []
+        self.build()
+
+    def build(self):
+        # O(n) construction: push each node's partial sum up to its parent.
+        self.tree = [0.0] + self.weights
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+        self.step = 1
+        while self.step * 2 <= self.size:
+            self.step *= 2
+
+    def update(self, ind: int, delta: float):
+        ind += 1
+        while ind <= self.size:
+            self.tree[ind] += delta
+            ind += ind & -ind
+
+    def total(self) -> float:
+        res = 0.0
+        ind = self.size
+        while ind > 0:
+            res += self.tree[ind]
+            ind -= ind & -ind
+        return res
+
+    def find(self, val: float) -> int:
+        # Binary lifting: largest position whose prefix sum is <= val.
+        # The index after it is the first one whose prefix sum exceeds val.
+        pos = 0
+        step = self.step
+        while step > 0:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] <= val:
+                pos = nxt
+                val -= self.tree[nxt]
+            step //= 2
+        return pos
+
+    def remove(self, ind: int):
+        weight = self.weights[ind]
+        if weight == 0:
+            return
+        self.removed.append((ind, weight))
+        self.weights[ind] = 0.0
+        self.update(ind, -weight)
+
+    def draw(self) -> int:
+        total = self.total()
+        if total <= 0:
+            raise ValueError("No weight left to draw from.")
+        ind = self.find(self.rand() * total)
+        if ind >= self.size or self.weights[ind] == 0:
+            # Floating point drift after many removals can land us on an emptied slot.
+            # Rebuilding is O(n) but happens very rarely.
+            self.build()
+            ind = self.find(self.rand() * self.total())
+            if ind >= self.size or self.weights[ind] == 0:
+                ind = max(i for i in range(self.size) if self.weights[i] > 0)
+        self.remove(ind)
+        return ind
+
+    def sample(self, count: int) -> List[int]:
+        """ Draws count distinct indices, then restores the tree.
+        """
+        try:
+            return [self.draw() for i in range(count)]
+        finally:
+            self.restore()
+
+    def restore(self):
+        while self.removed:
+            ind, weight = self.removed.pop()
+            self.weights[ind] = weight
+            self.update(ind, weight)
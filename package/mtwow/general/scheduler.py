@@ -0,0 +1,94 @@
+"""
+Runs named timers on the bot's event loop.
+"""
+import asyncio
+import heapq
+import itertools
+import inspect
+import logging
+import time
+from typing import Callable, Optional
+discord_logger = logging.getLogger("discord")
+
+def now() -> int:
+    return time.time_ns() // 1000000
+
+class Scheduler:
+    """ Keeps every timer in one heap, ordered by absolute deadline in ms since epoch.
+        A single task sleeps until the earliest one is due, so timers cost nothing while they wait.
+        Scheduling a name that is already pending reschedules it.
+    """
+    def __init__(self):
+        # (when, seq, name). Cancelled or rescheduled entries stay in here until they reach the top.
+        self.heap = []
+        # name -> (when, seq, callback, args)
+        self.timers = {}
+        self.seq = itertools.count()
+        self.wakeup = None
+        self.task = None
+        # callbacks still running. The event loop only keeps weak references to tasks, so these are kept here until they finish.
+        self.firing = set()
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            self.task = loop.create_task(self.run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def schedule(self, name: str, when: int, callback: Callable, *args):
+        seq = next(self.seq)
+        self.timers[name] = (when, seq, callback, args)
+        heapq.heappush(self.heap, (when, seq, name))
+        discord_logger.debug("Scheduled timer %s for %d", name, when)
+        if self.heap[0][1] == seq and self.wakeup is not None:
+            self.wakeup.set()
+
+    def cancel(self, name: str):
+        if self.timers.pop(name, None) is not None:
+            discord_logger.debug("Cancelled timer %s", name)
+
+    def pending(self, name: str) -> Optional[int]:
+        timer = self.timers.get(name)
+        return None if timer is None else timer[0]
+
+    def live(self, entry: tuple) -> bool:
+        timer = self.timers.get(entry[2])
+        return timer is not None and timer[1] == entry[1]
+
+    async def run(self):
+        while True:
+            while self.heap and not self.live(self.heap[0]):
+                heapq.heappop(self.heap)
+            self.wakeup.clear()
+            if not self.heap:
+                await self.wakeup.wait()
+                continue
+            delay = (self.heap[0][0] - now()) / 1000
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=delay)
+                    # something earlier was scheduled, or the top was cancelled
+                    continue
+                except asyncio.TimeoutError:
+                    pass
+            when, seq, name = heapq.heappop(self.heap)
+            if not self.live((when, seq, name)):
+                continue
+            when, seq, callback, args = self.timers.pop(name)
+            # run it as its own task, so a slow callback doesn't hold up the timers after it
+            task = asyncio.ensure_future(self.fire(name, callback, args))
+            self.firing.add(task)
+            task.add_done_callback(self.firing.discard)
+
+    async def fire(self, name: str, callback: Callable, args: tuple):
+        discord_logger.debug("Running timer %s", name)
+        try:
+            res = callback(*args)
+            if inspect.isawaitable(res):
+                await res
+        except Exception:
+            discord_logger.exception("Timer %s failed", name)
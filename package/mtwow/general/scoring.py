@@ -0,0 +1,116 @@
+"""
+Scores a round from its Votes and archives the results.
+Votes are decoded into position matrices and everything after that is done with NumPy array operations.
+Big rounds are scored in a compute worker, see compute.
+"""
+from . import sqlutils, user, compute
+import numpy as np
+import array
+import sqlite3
+import logging
+from typing import List, Tuple
+sql_logger = logging.getLogger("sqlite3")
+
+def loadRound(conn: sqlite3.Connection) -> Tuple[List[sqlite3.Row], List[Tuple[str, str]]]:
+    responses = conn.execute("SELECT id, uid, rid, response FROM Responses ORDER BY id;").fetchall()
+    votes = conn.execute("SELECT gseed, vote FROM Votes WHERE vote IS NOT NULL;").fetchall()
+    return (responses, [(vote[0], vote[1]) for vote in votes])
+
+def decodeVotes(votes: List[Tuple[str, str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """ Turns (gseed, vote) pairs into flat arrays of response IDs and the percentile each got.
+        A vote is a string of screen letters, best first. The top response of a screen of k gets 1, the bottom gets 0.
+        Responses left out of a partial vote share the average of the positions nobody took.
+        Votes that aren't valid for their screen are skipped.
+    """
+    # Full votes are grouped by screen size, so a whole group can be decoded at once.
+    full = {}
+    partialIDs = []
+    partialScores = []
+    for gseed, vote in votes:
+        # every screen is voted on once, so there's no point going through the screenIDs cache
+        try:
+            ids = user.decodeGSeed(gseed)
+        except ValueError:
+            continue
+        k = len(ids)
+        vote = vote.upper()
+        if k < 2 or len(vote) > k:
+            continue
+        if len(vote) == k:
+            group = full.setdefault(k, ([], []))
+            group[0].append(ids)
+            group[1].append(vote)
+            continue
+        positions = [ord(c) - 65 for c in vote]
+        if len(set(positions)) != len(positions) or not all(0 <= p < k for p in positions):
+            continue
+        scores = [None] * k
+        for place, p in enumerate(positions):
+            scores[p] = (k - 1 - place) / (k - 1)
+        # unranked responses take the mean of the places left over
+        rest = (k - 1 - (len(vote) + k - 1) / 2) / (k - 1)
+        partialIDs.extend(ids)
+        partialScores.extend(rest if s is None else s for s in scores)
+    allIDs = [np.array(partialIDs, dtype=np.int64)]
+    allScores = [np.array(partialScores, dtype=np.float64)]
+    for k, (ids, letters) in full.items():
+        ids = np.array(ids, dtype=np.int64)
+        # letters[v, place] = screen slot the voter put in that place
+        letters = np.frombuffer("".join(letters).encode("ascii", "replace"), dtype=np.uint8).reshape(-1, k).astype(np.int64) - 65
+        valid = np.all(np.sort(letters, axis=1) == np.arange(k), axis=1)
+        ids, letters = ids[valid], letters[valid]
+        # positions[v, slot] = place the voter put that slot in
+        positions = np.empty_like(letters)
+        np.put_along_axis(positions, letters, np.broadcast_to(np.arange(k), letters.shape), axis=1)
+        allIDs.append(ids.ravel())
+        allScores.append(((k - 1 - positions) / (k - 1)).ravel())
+    return (np.concatenate(allIDs), np.concatenate(allScores))
+
+def computeScores(responseIDs: np.ndarray, votes: List[Tuple[str, str]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ Returns (score, skew, rank) aligned with responseIDs, which must be sorted.
+        score is a response's mean percentile and skew its standard deviation. Rank 1 is the best.
+    """
+    ids, scores = decodeVotes(votes)
+    ind = np.searchsorted(responseIDs, ids)
+    # drop votes for responses that aren't in this round anymore
+    known = (ind < len(responseIDs)) & (responseIDs[np.minimum(ind, len(responseIDs) - 1)] == ids)
+    ind, scores = ind[known], scores[known]
+    counts = np.bincount(ind, minlength=len(responseIDs))
+    sums = np.bincount(ind, weights=scores, minlength=len(responseIDs))
+    squares = np.bincount(ind, weights=scores * scores, minlength=len(responseIDs))
+    seen = counts > 0
+    mean = np.zeros(len(responseIDs))
+    mean[seen] = sums[seen] / counts[seen]
+    skew = np.zeros(len(responseIDs))
+    skew[seen] = np.sqrt(np.maximum(squares[seen] / counts[seen] - mean[seen] ** 2, 0))
+    # best first; responses nobody voted on go last
+    order = np.lexsort((responseIDs, -mean, ~seen))
+    rank = np.empty(len(responseIDs), dtype=np.int64)
+    rank[order] = np.arange(1, len(responseIDs) + 1)
+    return (mean, skew, rank)
+
+def scoreSnapshot(responseIDs: np.ndarray, gseeds: Tuple[str, array.array], votes: Tuple[str, array.array]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """ computeScores on votes packed with compute.packStrings, for running in a worker.
+    """
+    return computeScores(responseIDs, list(zip(compute.unpackStrings(*gseeds), compute.unpackStrings(*votes))))
+
+def archiveRound(conn: sqlite3.Connection, responses: List[sqlite3.Row], mean: np.ndarray, skew: np.ndarray, rank: np.ndarray):
+    roundNum = sqlutils.roundNum(conn)
+    sql_logger.debug("Archiving %d responses for round %d", len(responses), roundNum)
+    conn.executemany("INSERT INTO ResponseArchive (roundNum, id, uid, rid, rank, response, score, skew) VALUES (?, ?, ?, ?, ?, ?, ?, ?);",
+        [(roundNum, resp["id"], resp["uid"], resp["rid"], int(rank[i]), resp["response"] or "", float(mean[i]), float(skew[i]))
+            for i, resp in enumerate(responses)])
+    sqlutils.refreshResults(conn, roundNum, sqlutils.getStatus(conn)["prompt"])
+
+def scoreRound(conn: sqlite3.Connection):
+    responses, votes = loadRound(conn)
+    if not responses:
+        return
+    sql_logger.info("Scoring %d responses from %d votes", len(responses), len(votes))
+    responseIDs = np.array([resp["id"] for resp in responses], dtype=np.int64)
+    if compute.inline(len(votes)):
+        mean, skew, rank = computeScores(responseIDs, votes)
+    else:
+        mean, skew, rank = compute.run(scoreSnapshot, len(votes), responseIDs,
+            compute.packStrings([vote[0] for vote in votes]), compute.packStrings([vote[1] for vote in votes]))
+    archiveRound(conn, responses, mean, skew, rank)
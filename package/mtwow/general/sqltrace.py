@@ -0,0 +1,123 @@
+"""
+Opt-in SQL tracing.
+Connections made with TracedConnection time a random sample of their statements and
+keep per-statement and per-call-site latency histograms and row counts in memory.
+"""
+from ...generic.metrics import Histogram
+import sqlite3
+import random
+import re
+import os
+import sys
+import threading
+import time
+from typing import List
+
+class StatementStats:
+    def __init__(self):
+        # time spent in execute, per call
+        self.latency = Histogram()
+        # time spent fetching results afterwards, in total
+        self.fetch = 0.0
+        self.rows = 0
+
+# sample rate, set by sqlutils.connect from dbConfig.traceSampleRate
+sampleRate = 0.0
+# normalised statement -> StatementStats
+statements = {}
+# "file:line function" -> StatementStats
+callSites = {}
+statsLock = threading.Lock()
+whitespace = re.compile(r"\s+")
+# frames from these files are skipped when working out who ran a statement
+skipFiles = (os.path.abspath(__file__), os.path.join(os.path.dirname(os.path.abspath(__file__)), "sqlutils.py"))
+
+def statsFor(table: dict, key: str) -> StatementStats:
+    stats = table.get(key)
+    if stats is None:
+        with statsLock:
+            stats = table.setdefault(key, StatementStats())
+    return stats
+
+def callSite() -> str:
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_filename in skipFiles:
+        frame = frame.f_back
+    if frame is None:
+        return "unknown"
+    return "{:s}:{:d} {:s}".format(os.path.basename(frame.f_code.co_filename), frame.f_lineno, frame.f_code.co_name)
+
+class TracedCursor(sqlite3.Cursor):
+    """ Adds fetch time and fetched rows to the stats of the statement that made it.
+    """
+    def track(self, stats: List[StatementStats], start: float, rows: int):
+        elapsed = time.perf_counter() - start
+        for s in stats:
+            s.fetch += elapsed
+            s.rows += rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self.track(self.stats, start, 0)
+            raise
+        self.track(self.stats, start, 1)
+        return row
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self.track(self.stats, start, row is not None)
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        start = time.perf_counter()
+        rows = super().fetchmany(*args, **kwargs)
+        self.track(self.stats, start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self.track(self.stats, start, len(rows))
+        return rows
+
+class TracedConnection(sqlite3.Connection):
+    """ Unsampled statements take the normal path, so leaving tracing on at a low rate is cheap.
+    """
+    def traced(self, method: str, sql: str, *args):
+        if sampleRate <= 0 or random.random() >= sampleRate:
+            return getattr(super(), method)(sql, *args)
+        stats = [statsFor(statements, whitespace.sub(" ", sql).strip()[:200]), statsFor(callSites, callSite())]
+        cursor = self.cursor(TracedCursor)
+        cursor.stats = stats
+        start = time.perf_counter()
+        getattr(cursor, method)(sql, *args)
+        elapsed = time.perf_counter() - start
+        for s in stats:
+            s.latency.record(elapsed)
+            if cursor.rowcount > 0:
+                s.rows += cursor.rowcount
+        return cursor
+
+    def execute(self, sql: str, *args):
+        return self.traced("execute", sql, *args)
+
+    def executemany(self, sql: str, *args):
+        return self.traced("executemany", sql, *args)
+
+def report(table: dict, limit: int = 10) -> List[str]:
+    """ The most expensive entries by total time, one line each.
+    """
+    with statsLock:
+        entries = sorted(table.items(), key=lambda e: e[1].latency.total + e[1].fetch, reverse=True)[:limit]
+    return ["{:8.1f}ms total {:6d}x p50 {:.2f}ms p99 {:.2f}ms {:7d} rows  {:s}".format(
+        (s.latency.total + s.fetch) * 1000, s.latency.count, s.latency.percentile(0.5) * 1000, s.latency.percentile(0.99) * 1000, s.rows, key)
+        for key, s in entries]
+
+def reset():
+    with statsLock:
+        statements.clear()
+        callSites.clear()
@@ -1,8 +1,123 @@
 import sqlite3
-from typing import List, Callable
+from typing import List, Callable, Optional
 from ...generic.utils import data
+from . import sqltrace, normalize
 import logging
+import pathlib
+import time
 sql_logger = logging.getLogger("sqlite3")
+# Database file behind each connection made by connect(), so per-database state is shared by its connections.
+databases = {}
+# Process-local copy of the single Status row, per database. It only ever holds committed values, since it's shared by
+# the writer and the read-only connections: the setters below hold their changes per connection until the commit.
+# Dropped, like every cache in caches, whenever a transaction is rolled back.
+statusCache = {}
+# connection -> Status columns it has changed in the transaction in progress
+statusWrites = {}
+# connections made by connect(readOnly=True)
+readers = set()
+statusColumns = ("roundNum", "prompt", "phase", "deadline", "startTime")
+# Every per-database cache of table contents, keyed by databaseKey. Other modules add theirs.
+caches = [statusCache]
+
+def addIndexes(conn: sqlite3.Connection):
+    # Responses are keyed by (uid, rid), so all but the latest of any duplicates have to go.
+    # They're kept in DroppedResponses rather than deleted outright, in case one was the one that mattered.
+    conn.execute("""CREATE TABLE IF NOT EXISTS DroppedResponses (
+        id INTEGER NOT NULL,
+        uid INTEGER NOT NULL,
+        rid INTEGER NOT NULL,
+        response TEXT,
+        confirmedVoteCount INTEGER,
+        pendingVoteCount INTEGER
+    );""")
+    dropped = conn.execute("""INSERT INTO DroppedResponses SELECT id, uid, rid, response, confirmedVoteCount, pendingVoteCount
+        FROM Responses WHERE id NOT IN (SELECT MAX(id) FROM Responses GROUP BY uid, rid);""").rowcount
+    if dropped:
+        sql_logger.warning("Moved %d duplicate responses to DroppedResponses", dropped)
+        conn.execute("DELETE FROM Responses WHERE id IN (SELECT id FROM DroppedResponses);")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS ResponsesByUID ON Responses (uid, rid);")
+    conn.execute("CREATE INDEX IF NOT EXISTS VotesByUID ON Votes (uid, vid);")
+    conn.execute("CREATE INDEX IF NOT EXISTS ArchiveByRound ON ResponseArchive (roundNum, rank);")
+    conn.execute("CREATE INDEX IF NOT EXISTS ArchiveByUID ON ResponseArchive (uid, roundNum);")
+
+def addResponseHashes(conn: sqlite3.Connection):
+    conn.execute("ALTER TABLE Responses ADD COLUMN wordCount INTEGER;")
+    conn.execute("ALTER TABLE Responses ADD COLUMN contentHash INTEGER;")
+    conn.execute("CREATE INDEX IF NOT EXISTS ResponsesByHash ON Responses (contentHash);")
+    conn.executemany("UPDATE Responses SET wordCount = ?, contentHash = ? WHERE id = ?;",
+        [(normalize.wordCount(row[1] or ""), normalize.contentHash(row[1] or ""), row[0]) for row in conn.execute("SELECT id, response FROM Responses;")])
+
+def addResultViews(conn: sqlite3.Connection):
+    conn.execute("""CREATE TABLE IF NOT EXISTS Rounds (
+        roundNum INTEGER PRIMARY KEY NOT NULL,
+        prompt TEXT,
+        responseCount INTEGER NOT NULL,
+        archivedAt UNSIGNED BIG INT NOT NULL
+    );""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS Leaderboard (
+        roundNum INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        uid INTEGER NOT NULL,
+        rid INTEGER NOT NULL,
+        response TEXT NOT NULL,
+        score DOUBLE NOT NULL,
+        skew DOUBLE NOT NULL,
+        PRIMARY KEY (roundNum, rank)
+    ) WITHOUT ROWID;""")
+    conn.execute("""CREATE TABLE IF NOT EXISTS ContestantHistory (
+        uid INTEGER NOT NULL,
+        roundNum INTEGER NOT NULL,
+        bestRank INTEGER NOT NULL,
+        responseCount INTEGER NOT NULL,
+        meanScore DOUBLE NOT NULL,
+        percentile DOUBLE NOT NULL,
+        PRIMARY KEY (uid, roundNum)
+    ) WITHOUT ROWID;""")
+    for row in conn.execute("SELECT DISTINCT roundNum FROM ResponseArchive;").fetchall():
+        refreshResults(conn, row[0], None)
+
+def rekeyVotes(conn: sqlite3.Connection):
+    # gseeds are unique per column in the original table, which can't be dropped in place
+    conn.execute("""CREATE TABLE VotesByMember (
+        id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+        uid INTEGER NOT NULL,
+        vid INTEGER NOT NULL,
+        gseed TEXT NOT NULL,
+        vote TEXT,
+        UNIQUE (uid, gseed)
+    );""")
+    conn.execute("INSERT INTO VotesByMember (id, uid, vid, gseed, vote) SELECT id, uid, vid, gseed, vote FROM Votes;")
+    conn.execute("DROP TABLE Votes;")
+    conn.execute("ALTER TABLE VotesByMember RENAME TO Votes;")
+    conn.execute("CREATE INDEX IF NOT EXISTS VotesByUID ON Votes (uid, vid);")
+
+# Schema upgrades, applied in order on top of the tables made by init.
+# Each is a script, or a function of the connection for upgrades that can't be done in SQL alone.
+# PRAGMA user_version holds how many of these a database has already had applied.
+migrations = [
+    # 1: indexes for the hot lookups, after setting aside any duplicate responses
+    addIndexes,
+    # 2: reminders are looked up by when they're next due
+    """
+    CREATE INDEX IF NOT EXISTS MembersByReminder ON Members (remindStart) WHERE remindStart IS NOT NULL;
+    """,
+    # 3: word counts and content hashes of responses, so validation and duplicate checks are lookups
+    addResponseHashes,
+    # 4: per-round leaderboards and per-contestant histories, materialized from ResponseArchive for the results site
+    addResultViews,
+    # 5: gseeds only identify a screen, and members can be shown the same one, so votes are keyed by (uid, gseed)
+    rekeyVotes,
+]
+
+# connection -> functions of it to run once its current transaction commits, see afterCommit
+committed = {}
+
+def afterCommit(conn: sqlite3.Connection, func: Callable[[sqlite3.Connection], None]):
+    """ Runs func(conn) in a transaction of its own once the handleSQLErrors transaction in progress commits.
+        Dropped if it rolls back. For work that can't be rolled back, like writing files.
+    """
+    committed.setdefault(conn, []).append(func)
 
 def handleSQLErrors(func: Callable):
     def handler(*args, **kwargs):
@@ -11,14 +126,111 @@ def handleSQLErrors(func: Callable):
         try:
             with args[0]:
                 res = func(*args, **kwargs)
-            return res
         except sqlite3.Error as e:
-            sql_logger.error(str(e))
+            committed.pop(args[0], None)
+            invalidateCaches(args[0])
+            sql_logger.error("%s", e)
             return (2, "SQL Error occurred.")
+        except BaseException:
+            committed.pop(args[0], None)
+            invalidateCaches(args[0])
+            raise
+        for callback in committed.pop(args[0], []):
+            try:
+                with args[0]:
+                    callback(args[0])
+            except Exception:
+                # what it followed up on is committed either way
+                invalidateCaches(args[0])
+                sql_logger.exception("Failed to run %s after commit", callback.__name__)
+        return res
     return handler
 
+def connect(path: str, readOnly: bool = False) -> sqlite3.Connection:
+    """ Opens a tuned connection to the database at path.
+        The writer runs in WAL mode, so read-only connections can read alongside it without waiting.
+    """
+    config = data.get("dbConfig", {})
+    if path != ":memory:":
+        path = str(pathlib.Path(path).resolve())
+    # tracing is off unless asked for, and then only a sample of statements is timed
+    sqltrace.sampleRate = config.get("traceSampleRate", 0)
+    factory = sqltrace.TracedConnection if sqltrace.sampleRate > 0 else sqlite3.Connection
+    if readOnly:
+        conn = sqlite3.connect(pathlib.Path(path).as_uri() + "?mode=ro", uri=True, check_same_thread=False,
+            cached_statements=config.get("cachedStatements", 256), factory=factory)
+        conn.execute("PRAGMA query_only = 1;")
+        readers.add(conn)
+    else:
+        conn = sqlite3.connect(path, cached_statements=config.get("cachedStatements", 256), factory=factory)
+        conn.execute("PRAGMA journal_mode = WAL;")
+        conn.execute("PRAGMA synchronous = NORMAL;")
+    # negative cache sizes are in KiB rather than pages
+    conn.execute("PRAGMA cache_size = {:d};".format(-config.get("cacheKiB", 16384)))
+    conn.execute("PRAGMA mmap_size = {:d};".format(config.get("mmapBytes", 256 * 1024 * 1024)))
+    conn.row_factory = sqlite3.Row
+    databases[conn] = path
+    sql_logger.debug("Opened %s connection to %s", "read-only" if readOnly else "read-write", path)
+    return conn
+
+def databaseKey(conn: sqlite3.Connection):
+    return databases.get(conn, conn)
+
+def getStatus(conn: sqlite3.Connection) -> dict:
+    status = statusCache.get(databaseKey(conn))
+    if status is None:
+        sql_logger.debug("Loading status")
+        row = conn.execute("SELECT roundNum, prompt, phase, deadline, startTime FROM Status WHERE id = 0;").fetchone()
+        status = dict(zip(statusColumns, row))
+        # A reader's snapshot may predate the last commit, and the writer's may hold changes that aren't committed yet.
+        # Either would put the wrong row in the cache.
+        if conn not in readers and not conn.in_transaction:
+            statusCache[databaseKey(conn)] = status
+        return status
+    pending = statusWrites.get(conn)
+    return dict(status, **pending) if pending else status
+
+def setStatus(conn: sqlite3.Connection, column: str, value):
+    updateStatus(conn, {column: value})
+
+def updateStatus(conn: sqlite3.Connection, values: dict):
+    """ Sets several Status columns in one statement. Must be called in a handleSQLErrors transaction.
+    """
+    conn.execute("UPDATE Status SET {:s} WHERE id = 0;".format(", ".join("{:s}=?".format(c) for c in values)), tuple(values.values()))
+    if conn not in statusWrites:
+        afterCommit(conn, publishStatus)
+    statusWrites.setdefault(conn, {}).update(values)
+
+def publishStatus(conn: sqlite3.Connection):
+    values = statusWrites.pop(conn, {})
+    status = statusCache.get(databaseKey(conn))
+    if status is not None:
+        # replaced rather than updated, so nobody holding the old one sees it change halfway
+        statusCache[databaseKey(conn)] = dict(status, **values)
+
+def invalidateStatus(conn: sqlite3.Connection):
+    statusCache.pop(databaseKey(conn), None)
+
+def invalidateCaches(conn: sqlite3.Connection):
+    statusWrites.pop(conn, None)
+    for cache in caches:
+        cache.pop(databaseKey(conn), None)
+
+def dropCaches(path: str):
+    """ Forgets everything cached about the database at path, e.g. once it has been closed for good.
+    """
+    for cache in caches:
+        cache.pop(str(pathlib.Path(path).resolve()), None)
+
+def close(conn: sqlite3.Connection):
+    databases.pop(conn, None)
+    readers.discard(conn)
+    statusWrites.pop(conn, None)
+    conn.close()
+
 @handleSQLErrors
 def init(conn: sqlite3.Connection):
+    invalidateCaches(conn)
     conn.executescript("""
     CREATE TABLE IF NOT EXISTS Members (
         uid INTEGER PRIMARY KEY NOT NULL,
@@ -75,9 +287,11 @@ def init(conn: sqlite3.Connection):
         skew DOUBLE NOT NULL
     );
     """)
+    applyMigrations(conn)
     
 @handleSQLErrors
 def wipe(conn: sqlite3.Connection):
+    invalidateCaches(conn)
     conn.executescript("""
         DROP TABLE IF EXISTS Members;
         DROP TABLE IF EXISTS Contestants;
@@ -85,85 +299,151 @@ def wipe(conn: sqlite3.Connection):
         DROP TABLE IF EXISTS Votes;
         DROP TABLE IF EXISTS Status;
         DROP TABLE IF EXISTS ResponseArchive;
+        DROP TABLE IF EXISTS Rounds;
+        DROP TABLE IF EXISTS Leaderboard;
+        DROP TABLE IF EXISTS ContestantHistory;
+        DROP TABLE IF EXISTS DroppedResponses;
+        PRAGMA user_version = 0;
     """)
+    # Exported rounds belong to the contest being wiped. Files can't be rolled back, so they're moved once this commits.
+    # history pulls in NumPy, so it's only imported when it's needed.
+    from . import history
+    afterCommit(conn, history.discard)
+
+def schemaVersion(conn: sqlite3.Connection) -> int:
+    return conn.execute("PRAGMA user_version;").fetchone()[0]
+
+def applyMigrations(conn: sqlite3.Connection):
+    for version in range(schemaVersion(conn), len(migrations)):
+        sql_logger.info("Migrating database to schema version %d", version + 1)
+        migration = migrations[version]
+        if callable(migration):
+            conn.execute("BEGIN;")
+            try:
+                migration(conn)
+                conn.execute("PRAGMA user_version = {:d};".format(version + 1))
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        else:
+            # executescript commits whatever is pending, so each migration brings its own transaction
+            conn.executescript("BEGIN;\n{:s}\nPRAGMA user_version = {:d};\nCOMMIT;".format(migration, version + 1))
+
+@handleSQLErrors
+def migrate(conn: sqlite3.Connection):
+    """ Upgrades an existing database in place. Databases that haven't been through init are left alone.
+    """
+    if conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'Status';").fetchone() is None:
+        return
+    applyMigrations(conn)
 
 def getTime(conn: sqlite3.Connection) -> int:
-    return conn.execute("SELECT startTime FROM Status;").fetchone()[0]
+    return getStatus(conn)["startTime"]
 
 def getDeadline(conn: sqlite3.Connection) -> int:
-    return conn.execute("SELECT deadline FROM Status;").fetchone()[0]
+    return getStatus(conn)["deadline"]
 
 def setPhase(conn: sqlite3.Connection, status: str):
-    sql_logger.debug("Set phase to {:s}".format(status))
-    conn.execute("UPDATE Status SET phase=?;", (status,))
+    sql_logger.debug("Set phase to %s", status)
+    setStatus(conn, "phase", status)
 
 def setDeadline(conn: sqlite3.Connection, time: int):
-    sql_logger.debug("Set deadline to {:d}ms after now.".format(time))
-    conn.execute("UPDATE Status SET deadline=?;", (time,))
+    sql_logger.debug("Set deadline to %dms after now.", time)
+    setStatus(conn, "deadline", time)
 
 def setStartTime(conn: sqlite3.Connection, time: int):
-    sql_logger.debug("Set time phase started to {:d}ms after epoch.".format(time))
-    conn.execute("UPDATE Status SET startTime=?;", (time,))
+    sql_logger.debug("Set time phase started to %dms after epoch.", time)
+    setStatus(conn, "startTime", time)
 
 def setPrompt(conn: sqlite3.Connection, prompt: str):
-    sql_logger.debug("Set prompt to:\n{:s}".format(prompt))
-    conn.execute("UPDATE Status SET prompt=?;", (prompt,))
+    sql_logger.debug("Set prompt to:\n%s", prompt)
+    setStatus(conn, "prompt", prompt)
+
+def setRoundNum(conn: sqlite3.Connection, roundNum: int):
+    sql_logger.debug("Set round number to %d", roundNum)
+    setStatus(conn, "roundNum", roundNum)
 
 def setAllResponseCount(conn: sqlite3.Connection, count: int):
-    sql_logger.debug("Set default response count to {:d}".format(count))
-    conn.execute("UPDATE Contestants SET allowedResponses = 1;")
+    sql_logger.debug("Set default response count to %d", count)
+    conn.execute("UPDATE Contestants SET allowedResponseCount = ?, responseCount = 0;", (count,))
+
+def countResponses(conn: sqlite3.Connection):
+    sql_logger.debug("Counting responses of every contestant")
+    conn.execute("""UPDATE Contestants SET responseCount = (SELECT COUNT(*) FROM Responses WHERE Responses.uid = Contestants.uid);""")
+
+def killNonResponders(conn: sqlite3.Connection) -> int:
+    """ Eliminates every living contestant without a response. Run countResponses first.
+    """
+    killed = conn.execute("UPDATE Contestants SET alive = 0 WHERE alive AND responseCount = 0;").rowcount
+    sql_logger.info("Eliminated %d contestants for not responding", killed)
+    return killed
+
+def clearRound(conn: sqlite3.Connection):
+    sql_logger.warning("Clearing responses and votes of round %d", roundNum(conn))
+    conn.execute("DELETE FROM Responses;")
+    conn.execute("DELETE FROM Votes;")
+    conn.execute("UPDATE Members SET roundVoteCount = 0 WHERE roundVoteCount != 0;")
 
 def wipeAllResponses(conn: sqlite3.Connection):
     sql_logger.warning("Wiping all responses!")
     conn.execute("DELETE FROM Responses;")
 
 def isContestant(conn: sqlite3.Connection, uid: int) -> bool:
-    sql_logger.debug("Checking if {:d} is a contestant.".format(uid))
+    sql_logger.debug("Checking if %d is a contestant.", uid)
     return isinstance(conn.execute("SELECT * FROM Contestants WHERE uid = ?;", (uid,)).fetchone(), sqlite3.Row)
 
 def getContestant(conn: sqlite3.Connection, uid: int) -> sqlite3.Row:
-    sql_logger.debug("Getting contestant with uid {:d}".format(uid))
+    sql_logger.debug("Getting contestant with uid %d", uid)
     return conn.execute("SELECT * FROM Contestants WHERE uid=?;", (uid,)).fetchone()
 
 def addContestant(conn: sqlite3.Connection, uid: int):
-    sql_logger.debug("Adding contestant with ID {:d}".format(uid))
+    sql_logger.debug("Adding contestant with ID %d", uid)
     conn.execute("INSERT INTO Contestants (uid, alive) VALUES (?, 1);", (uid,))
 
 def phase(conn: sqlite3.Connection) -> str:
-    sql_logger.debug("Getting current phase")
-    return conn.execute("SELECT phase FROM Status;").fetchone()[0]
+    return getStatus(conn)["phase"]
 
 def roundNum(conn: sqlite3.Connection) -> int:
-    sql_logger.debug("Getting round number")
-    return conn.execute("SELECT roundNum FROM Status;").fetchone()[0]
-
-def editResponse(conn: sqlite3.Connection, uid: int, responseNumber: int, response: str):
-    sql_logger.debug("Editing response {:d} of contestant {:d} to:\n{:s}".format(responseNumber, uid, response))
-    conn.execute("UPDATE Responses SET response=? WHERE uid=? AND rid=?;", (uid, responseNumber, response))
-
-def addResponse(conn: sqlite3.Connection, uid: int, responseNumber: int, response: str):
-    sql_logger.debug("Adding response {:d} of contestant {:d}:\n{:s}".format(responseNumber, uid, response))
-    conn.execute("INSERT INTO Responses (uid, rid, response) VALUES (?, ?, ?);", (uid, responseNumber, response))
-
+    return getStatus(conn)["roundNum"]
+
+def submissionState(conn: sqlite3.Connection, uid: int, responseNumber: int, contentHash: int) -> sqlite3.Row:
+    """ Everything respond checks, in one query: the phase, the contestant (NULL if uid isn't one),
+        whether they've already submitted this response, and whether anyone else has already submitted the same thing.
+    """
+    return conn.execute("""SELECT Status.phase, Contestants.uid IS NOT NULL AS contestant, Contestants.alive, Contestants.allowedResponseCount,
+        EXISTS (SELECT 1 FROM Responses WHERE uid = ?1 AND rid = ?2) AS submitted,
+        EXISTS (SELECT 1 FROM Responses WHERE contentHash = ?3 AND NOT (uid = ?1 AND rid = ?2)) AS duplicate
+        FROM Status LEFT JOIN Contestants ON Contestants.uid = ?1 WHERE Status.id = 0;""", (uid, responseNumber, contentHash)).fetchone()
+
+def upsertResponse(conn: sqlite3.Connection, uid: int, responseNumber: int, response: str, words: int, contentHash: int, new: bool):
+    """ Adds or replaces response responseNumber of uid. new says whether it's their first go, so responseCount goes up.
+    """
+    sql_logger.debug("Setting response %d of contestant %d to:\n%s", responseNumber, uid, response)
+    conn.execute("""INSERT INTO Responses (uid, rid, response, wordCount, contentHash) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(uid, rid) DO UPDATE SET response = excluded.response, wordCount = excluded.wordCount, contentHash = excluded.contentHash;""",
+        (uid, responseNumber, response, words, contentHash))
+    if new:
+        conn.execute("UPDATE Contestants SET responseCount = responseCount + 1 WHERE uid = ?;", (uid,))
 
 def getResponseByUID(conn: sqlite3.Connection, uid: int, responseNumber: int) -> sqlite3.Row:
-    sql_logger.debug("Getting response {:d} submitted by {:d}".format(responseNumber, uid))
+    sql_logger.debug("Getting response %d submitted by %d", responseNumber, uid)
     return conn.execute("SELECT * FROM Responses WHERE uid = ? AND rid = ?;", (uid, responseNumber)).fetchone()
 
 def getResponseByID(conn: sqlite3.Connection, id: int) -> sqlite3.Row:
-    sql_logger.debug("Getting response with ID {:d}".format(id))
+    sql_logger.debug("Getting response with ID %d", id)
     return conn.execute("SELECT * FROM Responses WHERE id = ?;", (id,)).fetchone()
 
 def allowedResponses(conn: sqlite3.Connection, uid: int) -> int:
-    sql_logger.debug("Getting number of responses for contestant {:d}".format(uid))
-    return conn.execute("SELECT allowedResponses FROM Contestants WHERE uid = ?;", (uid,)).fetchone()["allowedResponses"]
+    sql_logger.debug("Getting number of responses for contestant %d", uid)
+    return conn.execute("SELECT allowedResponseCount FROM Contestants WHERE uid = ?;", (uid,)).fetchone()["allowedResponseCount"]
 
 def getAllResponsesButOwn(conn: sqlite3.Connection, uid: int) -> List[sqlite3.Row]:
-    sql_logger.debug("Getting all responses except those of {:d}".format(uid))
+    sql_logger.debug("Getting all responses except those of %d", uid)
     return conn.execute("SELECT * FROM Responses WHERE uid != ?;", (uid,)).fetchall()
 
 def getAllResponsesButOne(conn: sqlite3.Connection, uid: int, responseNumber: int) -> List[sqlite3.Row]:
-    sql_logger.debug("Getting all responses except response {:d} submitted by {:d}".format(responseNumber, uid))
+    sql_logger.debug("Getting all responses except response %d submitted by %d", responseNumber, uid)
     return conn.execute("SELECT * FROM Responses WHERE uid != ? OR rid != ?;", (uid, responseNumber)).fetchall()
 
 def getAllResponses(conn: sqlite3.Connection) -> List[sqlite3.Row]:
@@ -176,22 +456,34 @@ def getAllContestants(conn: sqlite3.Connection) -> List[sqlite3.Row]:
 def killContestant(conn: sqlite3.Connection, uid: int):
     conn.execute("UPDATE Contestants SET alive=0 WHERE uid=?;", (uid,))
 
+def refreshResults(conn: sqlite3.Connection, roundNum: int, prompt: str):
+    """ Rebuilds the Leaderboard, ContestantHistory and Rounds rows of an archived round.
+    """
+    sql_logger.debug("Refreshing results of round %d", roundNum)
+    conn.execute("DELETE FROM Leaderboard WHERE roundNum = ?;", (roundNum,))
+    conn.execute("""INSERT INTO Leaderboard (roundNum, rank, uid, rid, response, score, skew)
+        SELECT roundNum, rank, uid, rid, response, score, skew FROM ResponseArchive WHERE roundNum = ?;""", (roundNum,))
+    conn.execute("DELETE FROM ContestantHistory WHERE roundNum = ?;", (roundNum,))
+    # percentile is of the contestant's best response: 1 for first place, 0 for last
+    conn.execute("""INSERT INTO ContestantHistory (uid, roundNum, bestRank, responseCount, meanScore, percentile)
+        SELECT uid, roundNum, MIN(rank), COUNT(*), AVG(score),
+            CASE WHEN total > 1 THEN 1.0 - (MIN(rank) - 1.0) / (total - 1) ELSE 1.0 END
+        FROM ResponseArchive, (SELECT COUNT(*) AS total FROM ResponseArchive WHERE roundNum = ?)
+        WHERE roundNum = ? GROUP BY uid;""", (roundNum, roundNum))
+    conn.execute("""INSERT OR REPLACE INTO Rounds (roundNum, prompt, responseCount, archivedAt)
+        SELECT ?, COALESCE(?, (SELECT prompt FROM Rounds WHERE roundNum = ?)), COUNT(*), ? FROM ResponseArchive WHERE roundNum = ?;""",
+        (roundNum, prompt, roundNum, time.time_ns() // 1000000, roundNum))
+
 def wordCount(string: str) -> int:
-    return len(string.split())
+    return normalize.wordCount(string)
 
 def removeDisallowedChars(string: str) -> str:
-    res = ""
-    for c in string:
-        # filter out:
-        #    - ZWSPs
-        #    - Newlines
-        # don't make me have to add more
-        if c not in "\u200b\n":
-            res += c
-    return res
-
-def expectedVoteCount(resp: sqlite3.Row) -> float:
-    return resp["confirmedVoteCount"] + resp["pendingVoteCount"] * data["voteConfig"]["pendingWeight"]
+    return normalize.normalize(string)
+
+def expectedVoteCount(resp: sqlite3.Row, pendingWeight: Optional[float] = None) -> float:
+    if pendingWeight is None:
+        pendingWeight = data["voteConfig"]["pendingWeight"]
+    return resp["confirmedVoteCount"] + resp["pendingVoteCount"] * pendingWeight
 
 def lessExpectedVotes(a: sqlite3.Row, b: sqlite3.Row) -> float:
     return expectedVoteCount(a) - expectedVoteCount(b)
\ No newline at end of file
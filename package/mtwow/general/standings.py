@@ -0,0 +1,208 @@
+"""
+In-memory standings by vote count and prizes, so rank and top-N lookups don't sort Members.
+Each board is a Fenwick tree counting members per score, loaded once per database and kept up to date
+as votes are flushed and rounds are archived.
+"""
+from . import sqlutils
+import sqlite3
+import threading
+import logging
+from typing import Dict, List, Optional, Tuple
+sql_logger = logging.getLogger("sqlite3")
+# what each board ranks by
+boardQueries = {
+    "aggregate": "SELECT uid, aggregateVoteCount FROM Members;",
+    "round": "SELECT uid, roundVoteCount FROM Members;",
+    "prized": "SELECT uid, prized FROM Contestants;"
+}
+
+class RankIndex:
+    """ Ranks members by a non-negative integer score. Tied members share a rank, 1 being the highest score.
+        Setting a score and looking up a rank are O(log s) where s is the highest score,
+        and the top n are O(n log s).
+    """
+    def __init__(self, scores: Dict[int, int]):
+        self.scores = {uid: max(int(score or 0), 0) for uid, score in scores.items()}
+        # score -> members with that score
+        self.buckets = {}
+        for uid, score in self.scores.items():
+            self.buckets.setdefault(score, set()).add(uid)
+        self.build(max(self.buckets, default=0))
+
+    def build(self, highest: int):
+        # tree[i] counts members with scores in (i - lowbit(i), i], shifted by one so score 0 fits
+        self.size = 1
+        while self.size <= highest + 1:
+            self.size *= 2
+        self.tree = [0] * (self.size + 1)
+        for score, members in self.buckets.items():
+            self.tree[score + 1] = len(members)
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+
+    def update(self, score: int, delta: int):
+        ind = score + 1
+        while ind <= self.size:
+            self.tree[ind] += delta
+            ind += ind & -ind
+
+    def atMost(self, score: int) -> int:
+        """ Number of members scoring score or less.
+        """
+        res = 0
+        ind = min(score + 1, self.size)
+        while ind > 0:
+            res += self.tree[ind]
+            ind -= ind & -ind
+        return res
+
+    def smallest(self, k: int) -> int:
+        """ Score of the k-th lowest member, 1 <= k <= len(self).
+        """
+        pos = 0
+        step = self.size
+        while step > 0:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] < k:
+                pos = nxt
+                k -= self.tree[nxt]
+            step //= 2
+        return pos
+
+    def set(self, uid: int, score: int):
+        score = max(int(score), 0)
+        old = self.scores.get(uid)
+        if old == score:
+            return
+        if old is not None:
+            self.buckets[old].discard(uid)
+            if not self.buckets[old]:
+                del self.buckets[old]
+            self.update(old, -1)
+        self.scores[uid] = score
+        self.buckets.setdefault(score, set()).add(uid)
+        if score >= self.size:
+            self.build(score)
+        else:
+            self.update(score, 1)
+
+    def add(self, uid: int, delta: int):
+        self.set(uid, self.scores.get(uid, 0) + delta)
+
+    def rank(self, uid: int) -> Optional[int]:
+        if uid not in self.scores:
+            return None
+        return len(self.scores) - self.atMost(self.scores[uid]) + 1
+
+    def top(self, n: int) -> List[Tuple[int, int, int]]:
+        """ (rank, uid, score) of the n best members, ties broken by uid.
+        """
+        res = []
+        while len(res) < min(n, len(self.scores)):
+            # every member of a bucket shares its rank, so jump a whole bucket at a time
+            score = self.smallest(len(self.scores) - len(res))
+            rank = len(self.scores) - self.atMost(score) + 1
+            res += [(rank, uid, score) for uid in sorted(self.buckets[score])]
+        return res[:n]
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+class Standings:
+    def __init__(self, conn: sqlite3.Connection):
+        sql_logger.debug("Loading standings")
+        self.boards = {name: RankIndex(dict(conn.execute(query).fetchall())) for name, query in boardQueries.items()}
+        self.lock = threading.Lock()
+
+# per database, dropped along with the other caches when a transaction rolls back
+indexes = {}
+sqlutils.caches.append(indexes)
+indexesLock = threading.Lock()
+
+def standingsFor(conn: sqlite3.Connection) -> Standings:
+    with indexesLock:
+        key = sqlutils.databaseKey(conn)
+        if key not in indexes:
+            indexes[key] = Standings(conn)
+        return indexes[key]
+
+def loaded(conn: sqlite3.Connection) -> Optional[Standings]:
+    # Updates only go to standings that are already loaded. Loading them mid-transaction
+    # would read the very rows being updated, and count the change twice.
+    # Boards change under standings.lock, so anything reading them has to hold it too.
+    with indexesLock:
+        return indexes.get(sqlutils.databaseKey(conn))
+
+@sqlutils.handleSQLErrors
+def load(conn: sqlite3.Connection):
+    """ Loads the standings up front, so the first lookup doesn't pay for it.
+    """
+    standingsFor(conn)
+
+def recordVotes(conn: sqlite3.Connection, counts: Dict[int, int]):
+    """ Adds newly flushed votes to the aggregate and round boards.
+    """
+    standings = loaded(conn)
+    if standings is None:
+        return
+    with standings.lock:
+        for uid, count in counts.items():
+            standings.boards["aggregate"].add(uid, count)
+            standings.boards["round"].add(uid, count)
+
+def setScores(conn: sqlite3.Connection, board: str, scores: Dict[int, int]):
+    """ Sets several members' scores on a board at once, adding any that aren't on it yet.
+    """
+    standings = loaded(conn)
+    if standings is None:
+        return
+    with standings.lock:
+        index = standings.boards[board]
+        for uid, score in scores.items():
+            index.set(uid, score)
+
+def join(conn: sqlite3.Connection, uid: int, boards: Tuple[str, ...]):
+    """ Puts uid on each of boards with a score of 0, unless they're already there.
+        New rows start at 0, so this is where a restart would have put them.
+    """
+    standings = loaded(conn)
+    if standings is None:
+        return
+    with standings.lock:
+        for board in boards:
+            if uid not in standings.boards[board].scores:
+                standings.boards[board].set(uid, 0)
+
+def resetRound(conn: sqlite3.Connection):
+    standings = loaded(conn)
+    if standings is None:
+        return
+    with standings.lock:
+        standings.boards["round"] = RankIndex({uid: 0 for uid in standings.boards["round"].scores})
+
+@sqlutils.handleSQLErrors
+def setPrized(conn: sqlite3.Connection, uid: int, prized: int):
+    sql_logger.debug("Set prizes of %d to %d", uid, prized)
+    conn.execute("UPDATE Contestants SET prized = ? WHERE uid = ?;", (prized, uid))
+    standings = loaded(conn)
+    if standings is None:
+        return
+    with standings.lock:
+        standings.boards["prized"].set(uid, prized)
+
+def rank(conn: sqlite3.Connection, board: str, uid: int) -> Optional[Tuple[int, int]]:
+    """ (rank, score) of uid on a board, or None if they aren't on it.
+    """
+    standings = standingsFor(conn)
+    with standings.lock:
+        index = standings.boards[board]
+        if uid not in index.scores:
+            return None
+        return (index.rank(uid), index.scores[uid])
+
+def top(conn: sqlite3.Connection, board: str, n: int) -> List[Tuple[int, int, int]]:
+    standings = standingsFor(conn)
+    with standings.lock:
+        return standings.boards[board].top(n)
@@ -1,13 +1,20 @@
 """
 Defines the functions needed for the common user.
 """
-from . import sqlutils
+from . import sqlutils, sampling, normalize, compute, standings
 from ...generic.utils import data
 import sqlite3
 import random
+import itertools
+import functools
+import collections
+import base64
+import array
+import threading
 import logging
-from typing import Tuple, Union, List, Callable
+from typing import Dict, Tuple, Union, List, Callable, Optional
 sql_logger = logging.getLogger("sqlite3")
+balancingSchemes = ("equal", "pareto", "linear", "strict")
 
 @sqlutils.handleSQLErrors
 def signup(conn: sqlite3.Connection, uid: int) -> Tuple[int, str]:
@@ -18,115 +25,326 @@ def signup(conn: sqlite3.Connection, uid: int) -> Tuple[int, str]:
     if sqlutils.phase(conn) != "signups" and (sqlutils.phase(conn) != "responding" or sqlutils.roundNum(conn) != 1):
         return (2, "Not in signup phase.")
     sqlutils.addContestant(conn, uid)
+    standings.join(conn, uid, ("prized",))
     return (0, "You have been signed up.")
     
 @sqlutils.handleSQLErrors
 def respond(conn: sqlite3.Connection, uid: int, responseNumber: int, response: str) -> Tuple[int, str]:
     responseNumber -= 1
-    if not sqlutils.isContestant(conn, uid):
+    response = normalize.normalize(response)
+    words = normalize.wordCount(response)
+    contentHash = normalize.contentHash(response)
+    state = sqlutils.submissionState(conn, uid, responseNumber, contentHash)
+    if not state["contestant"]:
         return (2, "You are not a contestant!")
-    if not sqlutils.getContestant(conn, uid)["alive"]:
+    if not state["alive"]:
         return (2, "You are eliminated!")
-    if sqlutils.phase(conn) != "respond":
+    if state["phase"] != "responding":
         return (2, "Not in responding phase.")
-    if sqlutils.allowedResponses(conn, uid) <= responseNumber:
+    if responseNumber < 0 or state["allowedResponseCount"] <= responseNumber:
         return (2, "You are not allowed to submit a response with that ID.")
+    if not response:
+        return (2, "Your response is empty.")
+    if state["duplicate"]:
+        return (2, "That response has already been submitted.")
     status = 0
-    if sqlutils.getResponseByUID(conn, uid, responseNumber):
-        sqlutils.editResponse(conn, uid, responseNumber, response)
-        message = "Your response has been edited!"
-    else:
-        sqlutils.addResponse(conn, uid, responseNumber, response)    
-        message = "Your response has been submitted!"
-    response = sqlutils.removeDisallowedChars(response)
-    if sqlutils.wordCount(response) > 10:
+    sqlutils.upsertResponse(conn, uid, responseNumber, response, words, contentHash, not state["submitted"])
+    message = "Your response has been edited!" if state["submitted"] else "Your response has been submitted!"
+    limit = data.get("responseConfig", {}).get("wordLimit", 10)
+    if words > limit:
         status = 1
-        message = "Your word count is over 10 words!"
-    elif sqlutils.wordCount(response) < 10:
-        message = "Your word count is under 10 words."
+        message = "Your word count is over {:d} words!".format(limit)
+    elif words < limit:
+        message = "Your word count is under {:d} words.".format(limit)
     return (status, message)
 
 @sqlutils.handleSQLErrors
 def newScreen(conn: sqlite3.Connection, uid: int, voteNumber: int, screenSize: int) -> Tuple[int, Union[List[sqlite3.Row], str]]:
-    # our pool of responses
-    allowedResponses = []
-    # weights per response
-    weights = []
-    # confirmed in our screen
-    screen = []
-    if data["voteConfig"]["giveContestantsOwnResponses"]:
-        resp = sqlutils.getResponseByUID(conn, uid, voteNumber)
-        if resp is not None:
-            screen.append(resp)
-            allowedResponses = sqlutils.getAllResponsesButOwn(conn, uid)
-            if screenSize > len(allowedResponses) + 1:
+    pool = pools.get(sqlutils.databaseKey(conn))
+    # screens with the voter's own response pinned to them are made to order
+    if pool is not None and not (data["voteConfig"]["giveContestantsOwnResponses"] and sqlutils.getResponseByUID(conn, uid, voteNumber)):
+        screen = pool.take(uid, screenSize)
+        if screen is not None:
+            serve(conn, screen)
+            return (0, screen)
+    res = newScreens(conn, [(uid, voteNumber)], screenSize)
+    if res[0] != 0:
+        return res
+    serve(conn, res[1][0])
+    return (0, res[1][0])
+
+@sqlutils.handleSQLErrors
+def newScreens(conn: sqlite3.Connection, voters: List[Tuple[int, int]], screenSize: int) -> Tuple[int, Union[List[List[sqlite3.Row]], str]]:
+    """ Generates one screen per (uid, voteNumber) pair.
+        The response pool and its weights are loaded once and shared by every screen.
+    """
+    if data["voteConfig"]["voteBalacingScheme"] not in balancingSchemes:
+        return (2, "Unknown vote balancing scheme.")
+    responses = sqlutils.getAllResponses(conn)
+    if screenSize > len(responses):
+        return (2, "Screen size requested too large.")
+    return (0, makeScreens(responses, voters, screenSize))
+
+def makeScreens(responses: List[sqlite3.Row], voters: List[Tuple[int, int]], screenSize: int) -> List[List[sqlite3.Row]]:
+    """ screensFromSnapshot, in a compute worker for big batches.
+    """
+    # single screens are cheaper to make than to ship to a worker, however many responses there are
+    if compute.inline(len(voters) * screenSize):
+        return screensFromSnapshot(responses, voters, screenSize)
+    ids = array.array("q", (resp["id"] for resp in responses))
+    uids = array.array("q", (resp["uid"] for resp in responses))
+    rids = array.array("q", (resp["rid"] for resp in responses))
+    expected = array.array("d", (sqlutils.expectedVoteCount(resp) for resp in responses))
+    screens = compute.run(screensFromColumns, len(voters) * screenSize,
+        dict(data["voteConfig"]), ids, uids, rids, expected, voters, screenSize)
+    byID = {resp["id"]: resp for resp in responses}
+    return [[byID[id] for id in screen] for screen in screens]
+
+def screensFromColumns(voteConfig: dict, ids: array.array, uids: array.array, rids: array.array, expected: array.array,
+        voters: List[Tuple[int, int]], screenSize: int) -> List[array.array]:
+    """ Runs in a compute worker. Returns the response IDs of each screen.
+    """
+    # expected already has pending votes weighted in
+    responses = [{"id": ids[i], "uid": uids[i], "rid": rids[i], "confirmedVoteCount": expected[i], "pendingVoteCount": 0} for i in range(len(ids))]
+    return [array.array("q", (resp["id"] for resp in screen)) for screen in screensFromSnapshot(responses, voters, screenSize, voteConfig)]
+
+def screensFromSnapshot(responses: List[sqlite3.Row], voters: List[Tuple[int, int]], screenSize: int,
+        voteConfig: Optional[dict] = None) -> List[List[sqlite3.Row]]:
+    """ voteConfig is the bot's by default. Compute workers are given it, rather than reading their own.
+    """
+    config = voteConfig if voteConfig is not None else data["voteConfig"]
+    # indices of each contestant's responses, and of each (uid, rid) pair
+    own = {}
+    byUID = {}
+    for i, resp in enumerate(responses):
+        own.setdefault(resp["uid"], []).append(i)
+        byUID[(resp["uid"], resp["rid"])] = i
+    strict = config["voteBalacingScheme"] == "strict"
+    if strict:
+        # Responses with less votes ALWAYS go first, so each screen just takes the lowest N it's allowed to see.
+        order = sorted(range(len(responses)), key=lambda i: sqlutils.expectedVoteCount(responses[i], config["pendingWeight"]))
+    else:
+        sampler = sampling.FenwickSampler(screenWeights(responses, config))
+    screens = []
+    for uid, voteNumber in voters:
+        # confirmed in our screen
+        screen = []
+        excluded = own.get(uid, [])
+        pinned = None
+        if config["giveContestantsOwnResponses"]:
+            pinned = byUID.get((uid, voteNumber))
+        if pinned is not None:
+            screen.append(pinned)
+            if screenSize > len(responses) - len(excluded) + 1:
                 # we won't have enough responses!
                 # allow own responses
-                allowedResponses = sqlutils.getAllResponsesButOne(conn, uid, voteNumber)
-                if screen > len(allowedResponses) + 1:
-                    # screen size too large >:(
-                    return (2, "Screen size requested too large.")
+                excluded = [pinned]
+        else:
+            excluded = []
+        numResps = screenSize - len(screen)
+        if strict:
+            excludedSet = set(excluded)
+            picks = list(itertools.islice((i for i in order if i not in excludedSet), numResps))
+            random.shuffle(picks)
         else:
-            allowedResponses = sqlutils.getAllResponses(conn)
-            if screenSize > len(allowedResponses):
-                return (2, "Screen size requested too large.")
-    scheme = data["voteConfig"]["voteBalacingScheme"]
-    if scheme == "equal":
-        # All responses are treated equally.
-        # Implemented by weighting all responses with weight 1
-        weights = [1 for i in allowedResponses]
+            for i in excluded:
+                sampler.remove(i)
+            # sample() puts the excluded responses back once it's done
+            picks = sampler.sample(numResps)
+        screen.extend(picks)
+        screens.append([responses[i] for i in screen])
+    return screens
+
+def screenWeights(allowedResponses: List[sqlite3.Row], voteConfig: Optional[dict] = None) -> List[float]:
+    config = voteConfig if voteConfig is not None else data["voteConfig"]
+    scheme = config["voteBalacingScheme"]
     if scheme == "pareto":
         # Responses are weighted by 1 / (voteCount + 1)
-        for resp in allowedResponses:
-            weights.append(10 / (sqlutils.expectedVoteCount(resp) + 1)) # 10 is on top so the randomisation range isn't too small
+        return [10 / (sqlutils.expectedVoteCount(resp, config["pendingWeight"]) + 1) for resp in allowedResponses] # 10 is on top so the randomisation range isn't too small
     if scheme == "linear":
         # Responses are weighted by maxVoteCount - thisVoteCount + 1
-        maxWeight = 0
-        for resp in allowedResponses:
-            maxWeight = max(sqlutils.expectedVoteCount(resp), maxWeight)
-        for resp in allowedResponses:
-            weights.append(maxWeight - sqlutils.expectedVoteCount(resp) + 1)
-    if scheme == "strict":
-        # Responses with less votes ALWAYS go first.
-        # Implemented by limiting response sample to lowest N responses as requested
-        # then allowing randomizer to select all N in whatever order.
-        allowedResponses.sort(key=sqlutils.expectedVoteCount)
-        numResps = screenSize - int(data["voteConfig"]["giveContestantsOwnResponses"])
-        allowedResponses = allowedResponses[0:numResps]
-        weights = [1 for i in allowedResponses]
-    # Fills the screen
-    while len(screen) < screenSize:
-        sumWeights = sum(weights) # sum weights
-        cumulativeWeights = [0]
-        for i in range(len(weights)):
-            cumulativeWeights.append(cumulativeWeights[i] + weights[i])
-        val = random.random() * sumWeights
-        # I could binary search but it's already O(n ^ 2) soooooo
-        for i in range(1, len(cumulativeWeights)):
-            if cumulativeWeights[i] > val:
-                ind = i
-                break
-        screen.append(allowedResponses[i-1])
-        del weights[ind]
-        del allowedResponses[ind]
+        counts = [sqlutils.expectedVoteCount(resp, config["pendingWeight"]) for resp in allowedResponses]
+        maxWeight = max(counts, default=0)
+        return [maxWeight - count + 1 for count in counts]
+    # All responses are treated equally.
+    # Implemented by weighting all responses with weight 1
+    return [1 for i in allowedResponses]
+
+class ScreenPool:
+    """ Screens made ahead of time, per screen size, so handing one out is O(1).
+        Screens from the pool aren't made for anyone in particular, so any that contain the voter's own response are skipped.
+        Screens handed out since the last vote flush aren't in pendingVoteCount yet, see served,
+        so they're added on when the next screens are made.
     """
-     Idea for possible weighted randomiser that runs in O(N log N): 
-     - N is the number of responses.
-     - Use a Fenwick Tree to find and update segment sums in O(log N).
-     - Generate a random float in the range indicated by [0, sum(0, N)], that's the sum of all the weights. We'll call this number "random".
-       - That's done in O(log N) time since Fenwick Tree queries are O(log N).
-     - Binary search to find the smallest index i such that: A[i] != 0, and sum(0, i) >= random.
-     - The first condition is to ensure that deletions are handled nicely.
-     - To handle deletions, we simply set A[i] = 0. 
-     This is pretty complicated and I won't use it since it's unlikely I'll get more than 100 responses
-     """
-    return (0, screen)
+    def __init__(self, sizes: List[int]):
+        config = data["voteConfig"]
+        self.target = config.get("poolSize", 100)
+        # how many screens to look through for one without the voter's own response before giving up
+        self.maxSkips = config.get("poolMaxSkips", 8)
+        self.screens = {size: collections.deque() for size in sizes}
+        # (size, "hit" | "miss" | "skip") -> count
+        self.stats = collections.Counter()
+        self.lock = threading.Lock()
+
+    def take(self, uid: int, size: int) -> Optional[List[sqlite3.Row]]:
+        with self.lock:
+            queue = self.screens.get(size)
+            for i in range(min(len(queue), self.maxSkips) if queue is not None else 0):
+                screen = queue.popleft()
+                if any(resp["uid"] == uid for resp in screen):
+                    # still good for anybody else
+                    queue.append(screen)
+                    self.stats[(size, "skip")] += 1
+                    continue
+                self.stats[(size, "hit")] += 1
+                return screen
+            self.stats[(size, "miss")] += 1
+            return None
 
+    def fill(self, conn: sqlite3.Connection):
+        responses = None
+        used = None
+        for size, queue in self.screens.items():
+            with self.lock:
+                need = self.target - len(queue)
+            if need <= 0:
+                continue
+            if responses is None:
+                # read before the response counts, so anything flushed in between is counted twice rather than not at all
+                used = servedSince(conn)
+                responses = sqlutils.getAllResponses(conn)
+            if size > len(responses):
+                continue
+            weighted = []
+            for resp in responses:
+                resp = dict(zip(resp.keys(), resp))
+                resp["pendingVoteCount"] += used.get(resp["id"], 0)
+                weighted.append(resp)
+            byID = {resp["id"]: resp for resp in responses}
+            screens = [[byID[resp["id"]] for resp in screen] for screen in makeScreens(weighted, [(None, None)] * need, size)]
+            with self.lock:
+                queue.extend(screens)
+
+# database -> ScreenPool for its current round of voting
+pools = {}
+# database -> response ID -> times it has been on a screen handed out since the last vote flush.
+# These are added to pendingVoteCount by the flush, see votes.buffered, so they're batched just like the votes.
+served = {}
+servedLock = threading.Lock()
+
+def serve(conn: sqlite3.Connection, screen: List[sqlite3.Row]):
+    with servedLock:
+        served.setdefault(sqlutils.databaseKey(conn), collections.Counter()).update(resp["id"] for resp in screen)
+
+def servedSince(conn: sqlite3.Connection) -> collections.Counter:
+    with servedLock:
+        return collections.Counter(served.get(sqlutils.databaseKey(conn)))
+
+def takeServed(conn: sqlite3.Connection) -> collections.Counter:
+    with servedLock:
+        return served.pop(sqlutils.databaseKey(conn), collections.Counter())
+
+def unserve(conn: sqlite3.Connection, counts: collections.Counter):
+    # for a flush that failed, so its counts wait for the next one
+    with servedLock:
+        served.setdefault(sqlutils.databaseKey(conn), collections.Counter()).update(counts)
+
+def warmPool(conn: sqlite3.Connection, sizes: List[int]):
+    """ Starts a fresh pool for a new round of voting, full of screens of each size.
+    """
+    dropPool(conn)
+    if data["voteConfig"]["voteBalacingScheme"] == "strict":
+        # every screen made from one snapshot would be the same, so these are made to order
+        return
+    pool = ScreenPool(sizes)
+    pool.fill(conn)
+    pools[sqlutils.databaseKey(conn)] = pool
+
+def dropPool(conn: sqlite3.Connection):
+    pools.pop(sqlutils.databaseKey(conn), None)
+
+def topUpPool(conn: sqlite3.Connection):
+    """ Refills the pool with screens made from the latest vote counts. Only reads, so it can run on a reader.
+    """
+    pool = pools.get(sqlutils.databaseKey(conn))
+    if pool is not None:
+        pool.fill(conn)
+
+def poolStats() -> Dict[str, float]:
+    res = collections.Counter()
+    for pool in list(pools.values()):
+        with pool.lock:
+            for (size, result), count in pool.stats.items():
+                res['{{size="{:d}",result="{:s}"}}'.format(size, result)] += count
+    return res
+
+def poolLevels() -> Dict[str, float]:
+    res = collections.Counter()
+    for pool in list(pools.values()):
+        with pool.lock:
+            for size, queue in pool.screens.items():
+                res['{{size="{:d}"}}'.format(size)] += len(queue)
+    return res
+
+# gseeds start with a version letter, followed by the screen's response IDs as unsigned LEB128 varints in unpadded URL-safe base64.
+# Older gseeds are the decimal IDs joined with "-", and always start with a digit.
+gseedVersion = "A"
+# (database, gseed) -> resolved screen, most recently used last
+screenCache = collections.OrderedDict()
+screenCacheLock = threading.Lock()
 
 def getGSeed(screen: List[sqlite3.Row]) -> str:
-    return "-".join([resp["id"] for resp in screen])
+    res = bytearray()
+    for resp in screen:
+        id = resp["id"]
+        while id >= 0x80:
+            res.append(id & 0x7f | 0x80)
+            id >>= 7
+        res.append(id)
+    return gseedVersion + base64.urlsafe_b64encode(bytes(res)).rstrip(b"=").decode("ascii")
+
+def decodeGSeed(gseed: str) -> List[int]:
+    if gseed[:1].isdigit():
+        return list(map(int, gseed.split("-")))
+    if gseed[:1] != gseedVersion:
+        raise ValueError("Unknown gseed version.")
+    body = gseed[1:]
+    ids = []
+    id = shift = 0
+    # validated, since the lenient decoder would skip over stray characters rather than reject them
+    for b in base64.b64decode(body + "=" * (-len(body) % 4), altchars=b"-_", validate=True):
+        id |= (b & 0x7f) << shift
+        shift += 7
+        if b < 0x80:
+            ids.append(id)
+            id = shift = 0
+    if shift or not ids:
+        raise ValueError("Truncated gseed.")
+    return ids
+
+@functools.lru_cache(maxsize=4096)
+def screenIDs(gseed: str) -> Tuple[int, ...]:
+    return tuple(decodeGSeed(gseed))
 
 @sqlutils.handleSQLErrors
-def getScreen(conn: sqlite3.Connection, gseed: str) -> List[sqlite3.Row]:
-    return [sqlutils.getResponseByID(conn, int(p)) for p in gseed.split("-")]
-    
\ No newline at end of file
+def getScreen(conn: sqlite3.Connection, gseed: str) -> Tuple[int, Union[List[sqlite3.Row], str]]:
+    key = (sqlutils.databaseKey(conn), gseed)
+    with screenCacheLock:
+        screen = screenCache.get(key)
+        if screen is not None:
+            screenCache.move_to_end(key)
+            return (0, screen)
+    try:
+        ids = screenIDs(gseed)
+    except ValueError:
+        return (2, "Invalid screen ID.")
+    rows = conn.execute("SELECT * FROM Responses WHERE id IN ({:s});".format(", ".join("?" * len(ids))), ids).fetchall()
+    byID = {row["id"]: row for row in rows}
+    if len(byID) != len(set(ids)):
+        return (2, "That screen no longer exists.")
+    screen = [byID[id] for id in ids]
+    with screenCacheLock:
+        screenCache[key] = screen
+        if len(screenCache) > data["voteConfig"].get("screenCacheSize", 1024):
+            screenCache.popitem(last=False)
+    return (0, screen)
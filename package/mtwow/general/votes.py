@@ -0,0 +1,153 @@
+"""
+Write-behind ingestion of votes.
+Votes are buffered per database and written in batches, so a burst near the deadline
+costs one transaction per batch rather than one per vote.
+"""
+from . import sqlutils, user, standings
+from ...generic.utils import data
+import collections
+import contextlib
+import threading
+import sqlite3
+import time
+import logging
+from typing import Dict, Tuple
+sql_logger = logging.getLogger("sqlite3")
+# SQLite's default limit on bound parameters is 999, so IN (...) lookups are split into chunks of this size.
+chunkSize = 500
+
+class VoteQueue:
+    def __init__(self):
+        config = data.get("voteConfig", {})
+        # flush once this many screens are waiting...
+        self.maxBatch = config.get("batchSize", 200)
+        # ...or once the oldest has waited this many ms
+        self.maxDelay = config.get("batchDelay", 1000)
+        # (uid, gseed) -> (vid, vote). Re-submitting a screen replaces the vote still waiting for it.
+        # gseeds only hold response IDs, so two members shown the same screen share one.
+        self.pending = {}
+        self.oldest = None
+        self.lock = threading.Lock()
+
+    def submit(self, uid: int, vid: int, gseed: str, vote: str):
+        with self.lock:
+            if not self.pending:
+                self.oldest = time.monotonic()
+            self.pending[(uid, gseed)] = (vid, vote)
+
+    def due(self) -> bool:
+        with self.lock:
+            if not self.pending:
+                return False
+            return len(self.pending) >= self.maxBatch or (time.monotonic() - self.oldest) * 1000 >= self.maxDelay
+
+    def take(self) -> Dict[Tuple[int, str], Tuple[int, str]]:
+        with self.lock:
+            batch = self.pending
+            self.pending = {}
+            self.oldest = None
+        return batch
+
+    def requeue(self, batch: Dict[Tuple[int, str], Tuple[int, str]]):
+        # Used when a flush fails. Anything submitted since is newer, so it wins.
+        with self.lock:
+            if not self.pending:
+                self.oldest = time.monotonic()
+            batch.update(self.pending)
+            self.pending = batch
+
+queues = {}
+queuesLock = threading.Lock()
+
+def queueFor(conn: sqlite3.Connection) -> VoteQueue:
+    with queuesLock:
+        key = sqlutils.databaseKey(conn)
+        if key not in queues:
+            queues[key] = VoteQueue()
+        return queues[key]
+
+def submitVote(conn: sqlite3.Connection, uid: int, vid: int, gseed: str, vote: str):
+    if sqlutils.phase(conn) != "voting":
+        return (2, "Not in voting phase.")
+    try:
+        size = len(user.screenIDs(gseed))
+    except ValueError:
+        return (2, "Invalid screen ID.")
+    # the best of the screen's letters first; any left out share the places after them, see scoring
+    vote = vote.upper()
+    letters = [ord(c) - 65 for c in vote]
+    if not vote or len(set(letters)) != len(letters) or not all(0 <= i < size for i in letters):
+        return (2, "Votes must be distinct letters from A to {:s}.".format(chr(64 + size)))
+    queue = queueFor(conn)
+    queue.submit(uid, vid, gseed, vote)
+    if queue.due():
+        return flushVotes(conn)
+
+def flushIfDue(conn: sqlite3.Connection):
+    if queueFor(conn).due():
+        return flushVotes(conn)
+
+@sqlutils.handleSQLErrors
+def flushVotes(conn: sqlite3.Connection):
+    """ Writes every buffered vote in one transaction.
+    """
+    with buffered(conn):
+        pass
+
+@contextlib.contextmanager
+def buffered(conn: sqlite3.Connection):
+    """ Writes every buffered vote, and the screens handed out since the last flush, as part of the caller's transaction, before the body runs.
+        If anything fails before the block ends, the votes go back in the queue, since the transaction will be rolled back.
+        end_voting scores the round inside this, so nothing is left in memory.
+    """
+    queue = queueFor(conn)
+    batch = queue.take()
+    served = user.takeServed(conn)
+    try:
+        if served:
+            # before the votes, which take their screens back off pendingVoteCount
+            conn.executemany("UPDATE Responses SET pendingVoteCount = pendingVoteCount + ? WHERE id = ?;",
+                [(count, id) for id, count in served.items()])
+        if batch:
+            standings.recordVotes(conn, writeVotes(conn, batch))
+        yield
+    except BaseException:
+        if batch:
+            queue.requeue(batch)
+        if served:
+            user.unserve(conn, served)
+        raise
+
+def writeVotes(conn: sqlite3.Connection, batch: Dict[Tuple[int, str], Tuple[int, str]]) -> Dict[int, int]:
+    """ Returns how many new votes each member cast.
+    """
+    sql_logger.debug("Writing %d votes", len(batch))
+    keys = list(batch)
+    existing = set()
+    # Joined from a table of the batch's keys, so each is a search of the (uid, gseed) index.
+    # A plain (uid, gseed) IN (...) scans the whole table instead, and that gets slower with every vote cast.
+    for i in range(0, len(keys), chunkSize // 2):
+        chunk = keys[i:i + chunkSize // 2]
+        existing.update((row[0], row[1]) for row in conn.execute(
+            """WITH Batch (uid, gseed) AS (VALUES {:s})
+            SELECT Votes.uid, Votes.gseed FROM Batch JOIN Votes ON Votes.uid = Batch.uid AND Votes.gseed = Batch.gseed;""".format(
+                ", ".join(["(?, ?)"] * len(chunk))), [value for key in chunk for value in key]))
+    conn.executemany("""INSERT INTO Votes (uid, vid, gseed, vote) VALUES (?, ?, ?, ?)
+        ON CONFLICT(uid, gseed) DO UPDATE SET vote = excluded.vote;""",
+        [(uid, vid, gseed, vote) for (uid, gseed), (vid, vote) in batch.items()])
+    # Only screens a member votes on for the first time move the counts; edits just replace the vote.
+    responseVotes = collections.Counter()
+    memberVotes = collections.Counter()
+    for (uid, gseed), (vid, vote) in batch.items():
+        if (uid, gseed) in existing:
+            continue
+        responseVotes.update(user.screenIDs(gseed))
+        memberVotes[uid] += 1
+    conn.executemany("""UPDATE Responses SET confirmedVoteCount = confirmedVoteCount + ?,
+        pendingVoteCount = MAX(pendingVoteCount - ?, 0) WHERE id = ?;""",
+        [(count, count, id) for id, count in responseVotes.items()])
+    conn.executemany("""INSERT INTO Members (uid, aggregateVoteCount, roundVoteCount) VALUES (?, ?, ?)
+        ON CONFLICT(uid) DO UPDATE SET aggregateVoteCount = aggregateVoteCount + excluded.aggregateVoteCount,
+        roundVoteCount = roundVoteCount + excluded.roundVoteCount;""",
+        [(uid, count, count) for uid, count in memberVotes.items()])
+    return memberVotes
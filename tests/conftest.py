@@ -0,0 +1,43 @@
+from package.generic.utils import data
+from package.mtwow.general import admin, sqlutils, user
+import pytest
+
+@pytest.fixture(autouse=True)
+def config(monkeypatch):
+    """ A config in place of secrets.json, which tests shouldn't need.
+    """
+    values = {
+        "owner": 1,
+        "voteConfig": {"pendingWeight": 0.5, "giveContestantsOwnResponses": True, "voteBalacingScheme": "pareto"},
+        "reminderConfig": {"rate": 1000, "burst": 1000, "backoff": 0},
+        "computeConfig": {"workers": 0},
+    }
+    monkeypatch.setattr(data, "values", values)
+    return values
+
+@pytest.fixture
+def dbPath(tmp_path):
+    path = str(tmp_path / "contest.db")
+    yield path
+    sqlutils.dropCaches(path)
+
+@pytest.fixture
+def conn(dbPath):
+    conn = sqlutils.connect(dbPath)
+    sqlutils.init(conn)
+    yield conn
+    sqlutils.close(conn)
+
+@pytest.fixture
+def votingRound(conn):
+    """ A round in its voting phase, with one response from each of contestants 11 to 16. Returns the response IDs.
+    """
+    admin.start_signups(conn, 60000)
+    for uid in range(11, 17):
+        user.signup(conn, uid)
+    admin.start_responding(conn, 1, 60000, "Prompt")
+    for uid in range(11, 17):
+        user.respond(conn, uid, 1, "response number {:d}".format(uid))
+    admin.end_responding(conn)
+    admin.start_voting(conn, 60000, [3])
+    return [row[0] for row in conn.execute("SELECT id FROM Responses ORDER BY id;")]
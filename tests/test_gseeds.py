@@ -0,0 +1,31 @@
+from package.mtwow.general import user
+import base64
+import pytest
+
+@pytest.mark.parametrize("ids", [[1], [1, 2, 3], [127, 128, 129], [0, 2 ** 14, 2 ** 21 - 1], [10 ** 12, 5, 10 ** 18]])
+def test_round_trip(ids):
+    gseed = user.getGSeed([{"id": id} for id in ids])
+    assert gseed.startswith(user.gseedVersion)
+    assert "=" not in gseed and "-" not in gseed[:1]
+    assert user.decodeGSeed(gseed) == ids
+    assert user.screenIDs(gseed) == tuple(ids)
+
+def test_small_ids_take_a_byte_each():
+    assert len(user.getGSeed([{"id": id} for id in range(1, 13)])) == 1 + 16
+
+def test_legacy_gseeds():
+    assert user.decodeGSeed("12-7-300") == [12, 7, 300]
+    with pytest.raises(ValueError):
+        user.decodeGSeed("12-x-300")
+
+def test_truncated_varints_are_rejected():
+    # 300 is two bytes, so the first alone is cut off partway through
+    body = base64.urlsafe_b64encode(bytes([0xac])).rstrip(b"=").decode("ascii")
+    with pytest.raises(ValueError):
+        user.decodeGSeed(user.gseedVersion + body)
+    assert user.decodeGSeed(user.getGSeed([{"id": 300}])) == [300]
+
+@pytest.mark.parametrize("gseed", ["", "A", "Z123", "A!!", "AQ@@", "AQ==="])
+def test_malformed_gseeds_are_rejected(gseed):
+    with pytest.raises(ValueError):
+        user.decodeGSeed(gseed)
@@ -0,0 +1,52 @@
+from package.mtwow.general import admin, history, sqlutils, user, votes
+import os
+
+def finishRound(conn, ids):
+    # everyone ranks the screen of every response in ID order, so the first response wins
+    gseed = "-".join(map(str, ids))
+    for uid in (5, 6, 7):
+        assert votes.submitVote(conn, uid, 1, gseed, "ABCDEF") is None
+    assert admin.end_voting(conn) is None
+
+def test_finished_rounds_are_exported(conn, votingRound):
+    finishRound(conn, votingRound)
+    directory = history.archiveDirectory(conn)
+    assert os.path.isdir(history.roundDirectory(directory, 1))
+    archive = history.archiveFor(conn)
+    assert archive.rounds() == [1]
+    top = archive.top(1, 2)
+    assert [(row["rank"], row["uid"], row["response"]) for row in top] == [(1, 11, "response number 11"), (2, 12, "response number 12")]
+    assert top[0]["score"] == 1.0
+    record = archive.contestant(16)
+    assert record["rounds"] == 1 and record["bestRank"] == 6 and record["meanPercentile"] == 0.0
+    # nothing new to export
+    assert history.exportPending(conn) == []
+
+def test_reload_from_disk(conn, votingRound):
+    finishRound(conn, votingRound)
+    directory = history.archiveDirectory(conn)
+    history.invalidate(directory)
+    columns = history.archiveFor(conn).round(1)
+    assert columns.count == 6 and columns.prompt == "Prompt"
+    assert [columns.response(i) for i in range(2)] == ["response number 11", "response number 12"]
+    assert columns["rank"].tolist() == [1, 2, 3, 4, 5, 6]
+
+def test_wiped_contest_starts_a_new_archive(conn, votingRound):
+    finishRound(conn, votingRound)
+    assert sqlutils.wipe(conn) is None
+    sqlutils.init(conn)
+    admin.start_signups(conn, 60000)
+    user.signup(conn, 20)
+    user.signup(conn, 21)
+    admin.start_responding(conn, 1, 60000, "Another prompt")
+    user.respond(conn, 20, 1, "new contest")
+    user.respond(conn, 21, 1, "also new")
+    admin.end_responding(conn)
+    admin.start_voting(conn, 60000, [2])
+    ids = [row[0] for row in conn.execute("SELECT id FROM Responses ORDER BY id;")]
+    votes.submitVote(conn, 5, 1, "-".join(map(str, ids)), "AB")
+    admin.end_voting(conn)
+    assert [row["response"] for row in history.archiveFor(conn).top(1, 2)] == ["new contest", "also new"]
+    # the old contest's rounds are kept to one side
+    directory = history.archiveDirectory(conn)
+    assert [name for name in os.listdir(os.path.dirname(directory)) if ".archive.wiped-" in name]
@@ -0,0 +1,36 @@
+from package.mtwow.general import sqlutils
+import sqlite3
+
+def oldDatabase(path: str):
+    """ A database from before migrations, with a duplicate response and two members' votes on one screen.
+    """
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+    CREATE TABLE Responses (id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, uid INTEGER NOT NULL, rid INTEGER NOT NULL,
+        response TEXT, confirmedVoteCount INTEGER DEFAULT 0, pendingVoteCount INTEGER DEFAULT 0);
+    CREATE TABLE Votes (id INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, uid INTEGER NOT NULL, vid INTEGER NOT NULL,
+        gseed TEXT UNIQUE NOT NULL, vote TEXT);
+    INSERT INTO Responses (uid, rid, response) VALUES (5, 0, 'first'), (5, 0, 'second'), (6, 0, 'other');
+    INSERT INTO Votes (uid, vid, gseed, vote) VALUES (7, 0, '1-2', 'AB');
+    """)
+    conn.close()
+
+def test_migrations_keep_dropped_responses(dbPath, caplog):
+    oldDatabase(dbPath)
+    conn = sqlutils.connect(dbPath)
+    try:
+        sqlutils.init(conn)
+        assert sqlutils.schemaVersion(conn) == len(sqlutils.migrations)
+        assert [tuple(row) for row in conn.execute("SELECT uid, rid, response FROM Responses ORDER BY id;")] == [(5, 0, "second"), (6, 0, "other")]
+        assert [tuple(row) for row in conn.execute("SELECT id, response FROM DroppedResponses;")] == [(1, "first")]
+        assert "Moved 1 duplicate responses" in caplog.text
+        # members shown the same screen each get their own vote now
+        with conn:
+            conn.execute("INSERT INTO Votes (uid, vid, gseed, vote) VALUES (8, 0, '1-2', 'BA');")
+        assert conn.execute("SELECT COUNT(*) FROM Votes WHERE gseed = '1-2';").fetchone()[0] == 2
+    finally:
+        sqlutils.close(conn)
+
+def test_fresh_database_drops_nothing(conn):
+    assert sqlutils.schemaVersion(conn) == len(sqlutils.migrations)
+    assert conn.execute("SELECT COUNT(*) FROM DroppedResponses;").fetchone()[0] == 0
@@ -0,0 +1,72 @@
+from package.mtwow.general import admin, scoring, sqlutils, user, votes
+import time
+
+def alive(conn):
+    return {row[0]: row[1] for row in conn.execute("SELECT uid, alive FROM Contestants;")}
+
+def test_end_responding_counts_and_eliminates(conn):
+    admin.start_signups(conn, 60000)
+    for uid in (11, 12, 13):
+        user.signup(conn, uid)
+    admin.start_responding(conn, 2, 60000, "Prompt")
+    user.respond(conn, 11, 1, "first")
+    user.respond(conn, 11, 2, "second")
+    user.respond(conn, 12, 1, "only one")
+    assert admin.end_responding(conn) is None
+    assert alive(conn) == {11: 1, 12: 1, 13: 0}
+    assert dict(conn.execute("SELECT uid, responseCount FROM Contestants;").fetchall()) == {11: 2, 12: 1, 13: 0}
+
+def test_round_number_advances_after_results(conn, votingRound):
+    assert sqlutils.roundNum(conn) == 1
+    votes.submitVote(conn, 5, 1, "-".join(map(str, votingRound)), "ABCDEF")
+    assert admin.end_voting(conn) is None
+    assert sqlutils.phase(conn) == "results"
+    # the round is archived, and the next one starts clean
+    assert conn.execute("SELECT COUNT(*) FROM ResponseArchive WHERE roundNum = 1;").fetchone()[0] == 6
+    assert conn.execute("SELECT COUNT(*) FROM Responses;").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM Votes;").fetchone()[0] == 0
+    assert conn.execute("SELECT roundVoteCount, aggregateVoteCount FROM Members WHERE uid = 5;").fetchone()[:] == (0, 1)
+    admin.start_responding(conn, 1, 60000, "Round two")
+    assert sqlutils.roundNum(conn) == 2
+    assert sqlutils.getStatus(conn)["prompt"] == "Round two"
+
+def test_restarting_responding_keeps_the_round(conn):
+    admin.start_signups(conn, 60000)
+    admin.start_responding(conn, 1, 60000, "Prompt")
+    admin.start_responding(conn, 1, 60000, "Better prompt")
+    assert sqlutils.roundNum(conn) == 1
+
+def test_failed_end_voting_changes_nothing(conn, votingRound, monkeypatch):
+    gseed = "-".join(map(str, votingRound))
+    votes.submitVote(conn, 5, 1, gseed, "ABCDEF")
+    def fail(conn):
+        conn.execute("SELECT * FROM NoSuchTable;")
+    scoreRound = scoring.scoreRound
+    monkeypatch.setattr(scoring, "scoreRound", fail)
+    assert admin.end_voting(conn)[0] == 2
+    assert sqlutils.phase(conn) == "voting"
+    assert conn.execute("SELECT COUNT(*) FROM Votes;").fetchone()[0] == 0
+    # the vote is still waiting, and the retry scores it
+    monkeypatch.setattr(scoring, "scoreRound", scoreRound)
+    assert admin.end_voting(conn) is None
+    assert sqlutils.phase(conn) == "results"
+    assert conn.execute("SELECT COUNT(*) FROM ResponseArchive;").fetchone()[0] == 6
+
+def test_catch_up_ends_overdue_phases(conn):
+    admin.start_signups(conn, 60000)
+    user.signup(conn, 11)
+    admin.start_responding(conn, 1, 1, "Prompt")
+    time.sleep(0.01)
+    admin.catchUp(conn)
+    assert alive(conn) == {11: 0}
+    assert admin.deadline(conn) is None
+    # dealt with, so catching up again doesn't end anything
+    assert admin.catchUp(conn) is None
+
+def test_catch_up_leaves_running_phases(conn):
+    admin.start_signups(conn, 60000)
+    user.signup(conn, 11)
+    admin.start_responding(conn, 1, 60000, "Prompt")
+    admin.catchUp(conn)
+    assert alive(conn) == {11: 1}
+    assert admin.deadline(conn) is not None
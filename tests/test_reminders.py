@@ -0,0 +1,101 @@
+from package.mtwow.general import reminders, sqlutils
+from package.mtwow.general.asyncdb import AsyncDatabase
+import asyncio
+import time
+
+class FakeSink:
+    """ Records what would have been sent. Fails the first failures[uid] sends to uid.
+    """
+    def __init__(self, failures: dict = None):
+        self.sent = []
+        self.failures = dict(failures or {})
+
+    async def send(self, uid: int, message: str):
+        if self.failures.get(uid, 0) > 0:
+            self.failures[uid] -= 1
+            raise ConnectionError("sink unavailable")
+        self.sent.append((uid, message))
+
+def now() -> int:
+    return time.time_ns() // 1000000
+
+def runReminders(dbPath, setup, sink, retryable=lambda e: True):
+    """ Runs setup(conn) then the dispatcher twice, and returns what each run sent and the Members reminder columns.
+    """
+    async def main():
+        db = AsyncDatabase(dbPath)
+        try:
+            await db.call(sqlutils.init)
+            await db.call(setup)
+            dispatcher = reminders.ReminderDispatcher(sink.send, retryable)
+            runs = [await dispatcher.run(db, "vote!"), await dispatcher.run(db, "vote!")]
+            rows = await db.read(lambda conn: {row[0]: (row[1], row[2]) for row in conn.execute(
+                "SELECT uid, remindStart, remindInterval FROM Members;")})
+            return (runs, rows)
+        finally:
+            db.close()
+    return asyncio.run(main())
+
+def test_due_reminders_are_sent_once(dbPath):
+    start = now()
+    def setup(conn):
+        reminders.setReminder(conn, 5, start - 1000, 60000)
+        reminders.setReminder(conn, 6, start - 1000, None)
+        reminders.setReminder(conn, 7, start + 60000, 60000)
+    sink = FakeSink()
+    runs, rows = runReminders(dbPath, setup, sink)
+    # the second run finds nothing due, since the first moved everything on
+    assert runs == [2, 0]
+    assert sorted(sink.sent) == [(5, "vote!"), (6, "vote!")]
+    assert rows[5] == (start - 1000 + 60000, 60000)
+    # one-offs are cleared once sent
+    assert rows[6] == (None, None)
+    assert rows[7] == (start + 60000, 60000)
+
+def test_missed_slots_are_skipped(dbPath):
+    start = now() - 3500
+    sink = FakeSink()
+    runs, rows = runReminders(dbPath, lambda conn: reminders.setReminder(conn, 5, start, 1000), sink)
+    # three slots were missed while nothing ran, but only one reminder goes out
+    assert runs == [1, 0]
+    assert sink.sent == [(5, "vote!")]
+    due, interval = rows[5]
+    # still on the same cadence, at the first slot after now
+    assert (due - start) % interval == 0
+    assert start + 3500 < due <= now() + interval
+
+def test_failed_sends_are_retried(dbPath):
+    sink = FakeSink({5: 2})
+    runs, rows = runReminders(dbPath, lambda conn: reminders.setReminder(conn, 5, now() - 1, 60000), sink)
+    assert runs == [1, 0]
+    assert sink.sent == [(5, "vote!")]
+
+def test_permanent_failures_move_on(dbPath):
+    sink = FakeSink({5: 1})
+    start = now() - 1
+    runs, rows = runReminders(dbPath, lambda conn: reminders.setReminder(conn, 5, start, 60000), sink,
+        retryable=lambda e: not isinstance(e, ConnectionError))
+    # not retried, and not stuck being retried on every run either
+    assert runs == [0, 0]
+    assert sink.sent == []
+    assert rows[5] == (start + 60000, 60000)
+
+def test_batches(dbPath, config):
+    config["reminderConfig"]["batchSize"] = 3
+    def setup(conn):
+        for uid in range(10, 20):
+            reminders.setReminder(conn, uid, now() - 1, None)
+    sink = FakeSink()
+    runs, rows = runReminders(dbPath, setup, sink)
+    assert runs == [10, 0]
+    assert sorted(uid for uid, message in sink.sent) == list(range(10, 20))
+
+def test_token_bucket_limits_rate():
+    async def main():
+        bucket = reminders.TokenBucket(100, 2)
+        start = time.monotonic()
+        for i in range(7):
+            await bucket.acquire()
+        return time.monotonic() - start
+    # two go out at once and the other five wait a hundredth of a second each
+    assert 0.045 <= asyncio.run(main()) < 0.5
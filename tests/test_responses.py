@@ -0,0 +1,40 @@
+from package.mtwow.general import admin, sqlutils, user
+import pytest
+
+@pytest.fixture
+def responding(conn):
+    admin.start_signups(conn, 60000)
+    user.signup(conn, 11)
+    user.signup(conn, 12)
+    admin.start_responding(conn, 2, 60000, "Prompt")
+    return conn
+
+def stored(conn, uid):
+    return ([tuple(row) for row in conn.execute("SELECT rid, response FROM Responses WHERE uid = ? ORDER BY rid;", (uid,))],
+        conn.execute("SELECT responseCount FROM Contestants WHERE uid = ?;", (uid,)).fetchone()[0])
+
+def test_submit_and_edit(responding, config):
+    config["responseConfig"] = {"wordLimit": 3}
+    assert user.respond(responding, 11, 1, "one two  three") == (0, "Your response has been submitted!")
+    assert user.respond(responding, 11, 1, "four five six") == (0, "Your response has been edited!")
+    assert user.respond(responding, 11, 2, "seven eight nine ten") == (1, "Your word count is over 3 words!")
+    # edits replace the response without counting it again
+    assert stored(responding, 11) == ([(0, "four five six"), (1, "seven eight nine ten")], 2)
+
+@pytest.mark.parametrize("number", [0, -1, 3])
+def test_response_numbers_out_of_range(responding, number):
+    assert user.respond(responding, 11, number, "words")[0] == 2
+    assert stored(responding, 11) == ([], 0)
+
+def test_rejected_responses(responding):
+    user.respond(responding, 11, 1, "taken already")
+    assert user.respond(responding, 12, 1, "Taken  already") == (2, "That response has already been submitted.")
+    assert user.respond(responding, 12, 1, "   ") == (2, "Your response is empty.")
+    assert user.respond(responding, 13, 1, "not signed up") == (2, "You are not a contestant!")
+    assert stored(responding, 12) == ([], 0)
+
+def test_only_while_responding(responding):
+    user.respond(responding, 11, 1, "on time")
+    admin.end_responding(responding)
+    admin.start_voting(responding, 60000, [2])
+    assert user.respond(responding, 11, 1, "too late") == (2, "Not in responding phase.")
@@ -0,0 +1,63 @@
+from package.generic import web
+from package.mtwow.general import admin, results, votes
+from package.mtwow.general.asyncdb import AsyncDatabase
+import asyncio
+import email.utils
+import json
+import pytest
+
+@pytest.fixture
+def site(conn, dbPath, votingRound):
+    votes.submitVote(conn, 5, 1, "-".join(map(str, votingRound)), "ABCDEF")
+    admin.end_voting(conn)
+    db = AsyncDatabase(dbPath)
+    yield results.ResultsSite(db)
+    db.close()
+
+def get(site, path, **headers):
+    return asyncio.run(site.handle(web.Request("GET", path, {k.replace("_", "-"): v for k, v in headers.items()})))
+
+def test_pages(site):
+    res = get(site, "/results/round/1")
+    assert res.status == 200 and res.headers["Content-Type"] == "application/json"
+    page = json.loads(res.body)
+    assert page["prompt"] == "Prompt" and len(page["results"]) == 6
+    assert page["results"][0] == {"rank": 1, "uid": "11", "rid": 0, "response": "response number 11", "score": 1.0, "skew": 0.0}
+    assert [r["round"] for r in json.loads(get(site, "/results/").body)] == [1]
+    assert json.loads(get(site, "/results/contestant/16").body)["rounds"][0]["bestRank"] == 6
+    for path in ("/results/round/2", "/results/round/x", "/results/contestant/99", "/results/nothing/here"):
+        assert get(site, path).status == 404
+
+def test_etags(site):
+    first = get(site, "/results/round/1")
+    etag = first.headers["ETag"]
+    again = get(site, "/results/round/1", if_none_match=etag)
+    assert again.status == 304 and again.body == b"" and again.headers["ETag"] == etag
+    assert get(site, "/results/round/1", if_none_match='W/' + etag + ', "other"').status == 304
+    assert get(site, "/results/round/1", if_none_match="*").status == 304
+    assert get(site, "/results/round/1", if_none_match='"other"').status == 200
+    # If-None-Match wins over If-Modified-Since
+    assert get(site, "/results/round/1", if_none_match='"other"', if_modified_since=first.headers["Last-Modified"]).status == 200
+
+def test_last_modified(site):
+    lastModified = get(site, "/results/round/1").headers["Last-Modified"]
+    assert get(site, "/results/round/1", if_modified_since=lastModified).status == 304
+    earlier = email.utils.formatdate(email.utils.parsedate_to_datetime(lastModified).timestamp() - 60, usegmt=True)
+    assert get(site, "/results/round/1", if_modified_since=earlier).status == 200
+    assert get(site, "/results/round/1", if_modified_since="not a date").status == 200
+
+def test_pages_change_once_a_round_is_archived(site, conn):
+    site.cacheSeconds = 0
+    before = get(site, "/results/")
+    with conn:
+        conn.execute("UPDATE Rounds SET archivedAt = archivedAt + 1000, prompt = 'Edited';")
+    after = get(site, "/results/", if_none_match=before.headers["ETag"])
+    assert after.status == 200 and after.headers["ETag"] != before.headers["ETag"]
+    assert json.loads(after.body)[0]["prompt"] == "Edited"
+
+def test_cached_pages_are_served_without_asking_again(site, conn):
+    site.cacheSeconds = 60
+    before = get(site, "/results/")
+    with conn:
+        conn.execute("UPDATE Rounds SET archivedAt = archivedAt + 1000, prompt = 'Edited';")
+    assert get(site, "/results/").body == before.body
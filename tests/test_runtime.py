@@ -0,0 +1,41 @@
+from package.generic import runtime
+from package.mtwow.general import admin, contests, sqlutils, votes
+
+def test_close_runs_in_reverse_and_survives_failures():
+    rt = runtime.Runtime()
+    closed = []
+    def fail(resource):
+        raise RuntimeError("broken")
+    rt.resource("a", lambda: 1, closed.append)
+    rt.resource("b", lambda: 2, fail)
+    rt.resource("c", lambda: 3, closed.append)
+    rt.close()
+    assert closed == [3, 1]
+    # already closed, so exiting doesn't touch anything again
+    rt.abandon()
+    assert closed == [3, 1]
+
+def test_abandon_only_runs_abandoners():
+    rt = runtime.Runtime()
+    calls = []
+    rt.resource("a", lambda: 1, lambda r: calls.append(("close", r)), lambda r: calls.append(("abandon", r)))
+    rt.resource("b", lambda: 2, lambda r: calls.append(("close", r)))
+    rt.abandon()
+    assert calls == [("abandon", 1)]
+    rt.close()
+    assert calls == [("abandon", 1)]
+
+def test_abandoned_contest_keeps_buffered_votes(dbPath):
+    contest = contests.Contest("test", dbPath)
+    db = contest.open()
+    db.callSync(sqlutils.init)
+    db.callSync(admin.start_voting)
+    db.callSync(votes.submitVote, 5, 0, "1-2", "AB")
+    # as at exit, once the interpreter has stopped the database threads
+    db.executor.shutdown(wait=True)
+    contest.abandon()
+    conn = sqlutils.connect(dbPath)
+    try:
+        assert [tuple(row) for row in conn.execute("SELECT uid, gseed, vote FROM Votes;")] == [(5, "1-2", "AB")]
+    finally:
+        sqlutils.close(conn)
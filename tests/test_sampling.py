@@ -0,0 +1,38 @@
+from package.mtwow.general.sampling import FenwickSampler
+import collections
+import random
+import pytest
+
+def test_sample_is_distinct():
+    sampler = FenwickSampler([1.0] * 50, rand=random.Random(1).random)
+    for i in range(100):
+        drawn = sampler.sample(10)
+        assert len(set(drawn)) == 10
+        assert all(0 <= ind < 50 for ind in drawn)
+
+def test_zero_and_removed_weights_are_never_drawn():
+    weights = [0.0 if i % 3 == 0 else 1.0 for i in range(30)]
+    sampler = FenwickSampler(weights, rand=random.Random(2).random)
+    sampler.remove(1)
+    for i in range(200):
+        drawn = sampler.draw()
+        assert drawn % 3 != 0 and drawn != 1
+        sampler.restore()
+        sampler.remove(1)
+
+def test_sample_restores_weights():
+    sampler = FenwickSampler([1.0, 2.0, 3.0], rand=random.Random(3).random)
+    assert sorted(sampler.sample(3)) == [0, 1, 2]
+    assert sampler.weights == [1.0, 2.0, 3.0]
+    assert sampler.total() == pytest.approx(6.0)
+
+def test_draws_follow_weights():
+    sampler = FenwickSampler([1.0, 3.0], rand=random.Random(4).random)
+    counts = collections.Counter(sampler.sample(1)[0] for i in range(4000))
+    assert counts[1] / 4000 == pytest.approx(0.75, abs=0.03)
+
+def test_running_out_of_weight():
+    sampler = FenwickSampler([1.0, 0.0], rand=random.Random(5).random)
+    with pytest.raises(ValueError):
+        sampler.sample(2)
+    assert sampler.weights == [1.0, 0.0]
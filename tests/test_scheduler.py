@@ -0,0 +1,65 @@
+from package.mtwow.general import scheduler
+import asyncio
+
+def runTimers(setup, seconds=0.2):
+    """ Starts a Scheduler, runs setup(timers, fired) on it and returns the names fired within seconds, in order.
+    """
+    async def main():
+        timers = scheduler.Scheduler()
+        timers.start(asyncio.get_running_loop())
+        fired = []
+        await setup(timers, fired)
+        await asyncio.sleep(seconds)
+        timers.stop()
+        return fired
+    return asyncio.run(main())
+
+def after(ms):
+    return scheduler.now() + ms
+
+def test_fires_in_deadline_order():
+    async def setup(timers, fired):
+        timers.schedule("late", after(60), fired.append, "late")
+        timers.schedule("early", after(20), fired.append, "early")
+        timers.schedule("overdue", after(-1000), fired.append, "overdue")
+        timers.schedule("never", after(60000), fired.append, "never")
+    assert runTimers(setup) == ["overdue", "early", "late"]
+
+def test_reschedule_replaces_the_timer():
+    async def setup(timers, fired):
+        timers.schedule("a", after(30), fired.append, "first")
+        timers.schedule("b", after(60), fired.append, "b")
+        # later, then earlier again: only the last one counts
+        timers.schedule("a", after(100), fired.append, "second")
+        timers.schedule("a", after(10), fired.append, "third")
+        assert timers.pending("a") is not None
+    assert runTimers(setup) == ["third", "b"]
+
+def test_rescheduling_earlier_wakes_the_scheduler():
+    async def setup(timers, fired):
+        timers.schedule("a", after(60000), fired.append, "a")
+        await asyncio.sleep(0.02)
+        timers.schedule("a", after(10), fired.append, "a")
+    assert runTimers(setup, 0.1) == ["a"]
+
+def test_cancel():
+    async def setup(timers, fired):
+        timers.schedule("a", after(20), fired.append, "a")
+        timers.schedule("b", after(30), fired.append, "b")
+        timers.cancel("a")
+        timers.cancel("missing")
+        assert timers.pending("a") is None
+    assert runTimers(setup) == ["b"]
+
+def test_failing_and_async_callbacks():
+    async def setup(timers, fired):
+        def fail():
+            raise RuntimeError("broken")
+        async def slow(name):
+            await asyncio.sleep(0.05)
+            fired.append(name)
+        timers.schedule("fail", after(5), fail)
+        timers.schedule("slow", after(10), slow, "slow")
+        timers.schedule("quick", after(20), fired.append, "quick")
+    # a slow callback doesn't hold up the ones after it, and a failing one doesn't stop them
+    assert runTimers(setup) == ["quick", "slow"]
@@ -0,0 +1,35 @@
+from package.mtwow.general import scoring
+import numpy as np
+import pytest
+
+def gseed(*ids):
+    return "-".join(map(str, ids))
+
+def test_full_votes():
+    ids, scores = scoring.decodeVotes([(gseed(10, 20, 30), "CAB")])
+    assert dict(zip(ids.tolist(), scores.tolist())) == {30: 1.0, 10: 0.5, 20: 0.0}
+
+def test_partial_votes_share_the_remaining_places():
+    ids, scores = scoring.decodeVotes([(gseed(10, 20, 30, 40, 50), "B")])
+    result = dict(zip(ids.tolist(), scores.tolist()))
+    assert result[20] == 1.0
+    # the other four share places 2 to 5
+    assert all(result[id] == pytest.approx(0.375) for id in (10, 30, 40, 50))
+
+def test_invalid_votes_are_skipped():
+    ids, scores = scoring.decodeVotes([
+        (gseed(1, 2, 3), "AAB"),
+        (gseed(1, 2, 3), "ABCD"),
+        (gseed(1, 2, 3), "AD"),
+        ("?bad", "AB"),
+    ])
+    assert len(ids) == 0 and len(scores) == 0
+
+def test_compute_scores():
+    votes = [(gseed(1, 2, 3), "ABC"), (gseed(1, 2, 3), "BAC"), (gseed(5, 2), "b")]
+    # 4 is never shown, 5 isn't in the round anymore
+    mean, skew, rank = scoring.computeScores(np.array([1, 2, 3, 4]), votes)
+    assert mean.tolist() == pytest.approx([0.75, 5 / 6, 0.0, 0.0])
+    assert skew.tolist() == pytest.approx([0.25, np.sqrt(1 / 18), 0.0, 0.0])
+    # 3 was always voted last and still ranks above 4, which nobody saw
+    assert rank.tolist() == [2, 1, 3, 4]
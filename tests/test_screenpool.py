@@ -0,0 +1,56 @@
+from package.mtwow.general import sqlutils, user
+import collections
+
+def screen(*uids):
+    return [{"id": uid * 10, "uid": uid} for uid in uids]
+
+def pool(*screens):
+    pool = user.ScreenPool([2])
+    pool.screens[2].extend(screens)
+    return pool
+
+def test_screens_with_the_voters_response_are_skipped():
+    p = pool(screen(1, 2), screen(1, 3), screen(2, 3))
+    assert p.take(1, 2) == screen(2, 3)
+    # skipped screens are still there for everyone else, in the same order
+    assert list(p.screens[2]) == [screen(1, 2), screen(1, 3)]
+    assert p.take(2, 2) == screen(1, 3)
+    assert p.stats == collections.Counter({(2, "skip"): 3, (2, "hit"): 2})
+
+def test_gives_up_after_max_skips(config):
+    config["voteConfig"]["poolMaxSkips"] = 2
+    p = pool(screen(1, 2), screen(1, 3), screen(2, 3))
+    assert p.take(1, 2) is None
+    assert p.stats[(2, "miss")] == 1
+    assert len(p.screens[2]) == 3
+
+def test_unknown_size_misses():
+    assert pool().take(1, 5) is None
+
+def test_pool_screens_never_show_voters_their_own(conn, votingRound):
+    pool = user.pools[sqlutils.databaseKey(conn)]
+    hits = 0
+    for uid in range(11, 17):
+        for i in range(5):
+            screen = pool.take(uid, 3)
+            # a miss falls back to a screen made to order, which isn't the pool's to filter
+            if screen is not None:
+                hits += 1
+                assert uid not in [resp["uid"] for resp in screen]
+    assert hits > 0
+
+def test_refills_count_unflushed_screens(conn, votingRound, config, monkeypatch):
+    config["voteConfig"]["poolSize"] = 3
+    user.warmPool(conn, [3])
+    for i in range(3):
+        user.newScreen(conn, 5, 1, 3)
+    handedOut = user.servedSince(conn)
+    assert sum(handedOut.values()) == 9
+    seen = []
+    makeScreens = user.makeScreens
+    def spy(responses, voters, screenSize):
+        seen.extend(responses)
+        return makeScreens(responses, voters, screenSize)
+    monkeypatch.setattr(user, "makeScreens", spy)
+    user.topUpPool(conn)
+    assert {resp["id"]: resp["pendingVoteCount"] for resp in seen} == {id: handedOut[id] for id in votingRound}
@@ -0,0 +1,25 @@
+from package.mtwow.general import admin, standings, sqlutils, user, votes, reminders
+from package.mtwow import bulk
+
+def test_new_rows_join_loaded_boards(conn):
+    standings.load(conn)
+    admin.start_signups(conn, 60000)
+    assert user.signup(conn, 5)[0] == 0
+    reminders.setReminder(conn, 6, None, None)
+    assert bulk.importRows(conn, "members", [{"uid": 7, "aggregateVoteCount": 4, "roundVoteCount": 2}]) == 1
+    assert bulk.importRows(conn, "contestants", [{"uid": 8, "prized": 3}]) == 1
+    assert standings.top(conn, "prized", 5) == [(1, 8, 3), (2, 5, 0)]
+    assert standings.top(conn, "aggregate", 5) == [(1, 7, 4), (2, 6, 0)]
+    assert standings.rank(conn, "round", 6) == (2, 0)
+
+def test_boards_match_a_reload(conn, votingRound):
+    standings.load(conn)
+    votes.submitVote(conn, 5, 1, "1-2", "AB")
+    votes.submitVote(conn, 6, 1, "1-2", "BA")
+    votes.submitVote(conn, 6, 2, "2-1", "AB")
+    votes.flushVotes(conn)
+    reminders.setReminder(conn, 7, None, None)
+    live = {board: standings.top(conn, board, 10) for board in standings.boardQueries}
+    sqlutils.invalidateCaches(conn)
+    assert {board: standings.top(conn, board, 10) for board in standings.boardQueries} == live
+    assert live["aggregate"] == [(1, 6, 2), (2, 5, 1), (3, 7, 0)]
@@ -0,0 +1,46 @@
+from package.mtwow.general import admin, sqlutils
+import pytest
+
+@pytest.fixture
+def reader(conn, dbPath):
+    reader = sqlutils.connect(dbPath, readOnly=True)
+    yield reader
+    sqlutils.close(reader)
+
+def test_committed_changes_are_cached(conn, reader):
+    sqlutils.getStatus(conn)
+    admin.start_signups(conn, 60000)
+    assert sqlutils.statusCache[sqlutils.databaseKey(conn)]["phase"] == "signups"
+    assert sqlutils.phase(reader) == "signups"
+
+def test_uncommitted_changes_are_only_seen_by_the_writer(conn, reader):
+    seen = {}
+    @sqlutils.handleSQLErrors
+    def change(conn):
+        sqlutils.updateStatus(conn, {"phase": "voting", "prompt": "Prompt"})
+        seen["writer"] = sqlutils.getStatus(conn)
+        seen["reader"] = sqlutils.getStatus(reader)
+        seen["cache"] = dict(sqlutils.statusCache[sqlutils.databaseKey(conn)])
+    sqlutils.getStatus(conn)
+    assert change(conn) is None
+    assert seen["writer"]["phase"] == "voting" and seen["writer"]["prompt"] == "Prompt"
+    assert seen["reader"]["phase"] == "none" and seen["cache"]["phase"] == "none"
+    assert sqlutils.phase(reader) == "voting"
+
+def test_rolled_back_changes_are_never_seen(conn, reader):
+    @sqlutils.handleSQLErrors
+    def change(conn):
+        sqlutils.updateStatus(conn, {"phase": "voting"})
+        conn.execute("SELECT * FROM NoSuchTable;")
+    sqlutils.getStatus(conn)
+    assert change(conn)[0] == 2
+    assert sqlutils.phase(conn) == "none"
+    assert sqlutils.phase(reader) == "none"
+    assert conn not in sqlutils.statusWrites
+
+def test_a_reader_never_fills_the_cache(conn, reader):
+    sqlutils.invalidateStatus(conn)
+    assert sqlutils.phase(reader) == "none"
+    assert sqlutils.databaseKey(conn) not in sqlutils.statusCache
+    assert sqlutils.phase(conn) == "none"
+    assert sqlutils.databaseKey(conn) in sqlutils.statusCache
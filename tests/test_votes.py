@@ -0,0 +1,104 @@
+from package.mtwow.general import admin, user, votes
+import collections
+import pytest
+
+@pytest.fixture
+def responses(votingRound):
+    return votingRound
+
+def counts(conn):
+    return (dict(conn.execute("SELECT uid, aggregateVoteCount FROM Members;").fetchall()),
+        dict(conn.execute("SELECT id, confirmedVoteCount FROM Responses;").fetchall()))
+
+def test_queue_keeps_each_members_vote():
+    queue = votes.VoteQueue()
+    queue.submit(5, 1, "1-2-3", "ABC")
+    queue.submit(6, 1, "1-2-3", "CBA")
+    queue.submit(5, 1, "1-2-3", "BAC")
+    assert queue.take() == {(5, "1-2-3"): (1, "BAC"), (6, "1-2-3"): (1, "CBA")}
+    assert queue.take() == {}
+
+def test_requeue_keeps_newer_votes():
+    queue = votes.VoteQueue()
+    queue.submit(5, 1, "1-2", "AB")
+    batch = queue.take()
+    queue.submit(5, 1, "1-2", "BA")
+    queue.requeue(batch)
+    assert queue.take() == {(5, "1-2"): (1, "BA")}
+
+def test_members_sharing_a_screen_are_both_counted(conn, responses):
+    gseed = "-".join(map(str, responses))
+    assert votes.submitVote(conn, 5, 1, gseed, "ABC") is None
+    assert votes.submitVote(conn, 6, 1, gseed, "CBA") is None
+    assert votes.flushVotes(conn) is None
+    members, confirmed = counts(conn)
+    assert members == {5: 1, 6: 1}
+    assert confirmed == {id: 2 for id in responses}
+    assert sorted(map(tuple, conn.execute("SELECT uid, vote FROM Votes;"))) == [(5, "ABC"), (6, "CBA")]
+
+def test_revoting_replaces_without_counting_again(conn, responses):
+    gseed = "-".join(map(str, responses))
+    votes.submitVote(conn, 5, 1, gseed, "ABC")
+    votes.flushVotes(conn)
+    votes.submitVote(conn, 5, 1, gseed, "BCA")
+    votes.flushVotes(conn)
+    assert [row[0] for row in conn.execute("SELECT vote FROM Votes WHERE uid = 5;")] == ["BCA"]
+    assert counts(conn) == ({5: 1}, {id: 1 for id in responses})
+
+def test_invalid_votes_are_rejected(conn, responses):
+    assert votes.submitVote(conn, 5, 1, "?nope", "A")[0] == 2
+    for vote in ("", "AA", "ABZ", "A1"):
+        assert votes.submitVote(conn, 5, 1, "1-2-3", vote)[0] == 2
+    assert votes.submitVote(conn, 5, 1, "1-2-3", "cab") is None
+    assert votes.queueFor(conn).take() == {(5, "1-2-3"): (1, "CAB")}
+
+def test_votes_only_count_while_voting(conn, responses):
+    admin.end_voting(conn)
+    assert votes.submitVote(conn, 5, 1, "1-2-3", "ABC") == (2, "Not in voting phase.")
+    assert votes.queueFor(conn).take() == {}
+
+def test_failed_transaction_requeues(conn, responses):
+    gseed = "-".join(map(str, responses))
+    votes.submitVote(conn, 5, 1, gseed, "ABC")
+    with pytest.raises(RuntimeError):
+        with conn:
+            with votes.buffered(conn):
+                raise RuntimeError("scoring failed")
+    assert conn.execute("SELECT COUNT(*) FROM Votes;").fetchone()[0] == 0
+    assert votes.queueFor(conn).take() == {(5, gseed): (1, "ABC")}
+
+def test_batches_bigger_than_a_lookup_chunk(conn, responses):
+    gseed = "-".join(map(str, responses))
+    for uid in range(100, 400):
+        votes.submitVote(conn, uid, 1, gseed, "ABC")
+    votes.flushVotes(conn)
+    # half of these already voted, so only the other half count
+    for uid in range(250, 550):
+        votes.submitVote(conn, uid, 1, gseed, "CBA")
+    votes.flushVotes(conn)
+    members, confirmed = counts(conn)
+    assert len(members) == 450 and set(members.values()) == {1}
+    assert confirmed == {id: 450 for id in responses}
+
+def test_screens_handed_out_are_pending_until_voted_on(conn, votingRound):
+    pending = lambda: dict(conn.execute("SELECT id, pendingVoteCount FROM Responses;").fetchall())
+    screens = [user.newScreen(conn, uid, 1, 3)[1] for uid in (5, 6)]
+    # made to order, since 11 has a response of their own to see
+    screens.append(user.newScreen(conn, 11, 0, 3)[1])
+    assert screens[-1][0]["uid"] == 11
+    assert set(pending().values()) == {0}
+    votes.flushVotes(conn)
+    handedOut = collections.Counter(resp["id"] for screen in screens for resp in screen)
+    assert pending() == {id: handedOut[id] for id in votingRound}
+    votes.submitVote(conn, 5, 1, user.getGSeed(screens[0]), "ABC")
+    votes.flushVotes(conn)
+    handedOut.subtract(resp["id"] for resp in screens[0])
+    assert pending() == {id: handedOut[id] for id in votingRound}
+
+def test_failed_flush_keeps_screens_handed_out(conn, votingRound):
+    screen = user.newScreen(conn, 5, 1, 3)[1]
+    with pytest.raises(RuntimeError):
+        with conn:
+            with votes.buffered(conn):
+                raise RuntimeError("scoring failed")
+    assert user.servedSince(conn) == collections.Counter(resp["id"] for resp in screen)